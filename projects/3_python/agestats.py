@@ -0,0 +1,273 @@
+"""
+Mergeable age statistics per group (district, gender, nationality...).
+
+`mean_age_by_district` gives only a mean and needs a new pass over the
+records for any other statistic. `AgeStats` keeps, for every group, the
+count, mean and sum of squared deviations of the ages (Welford, merged with
+the parallel formula of Chan et al.) and the exact histogram of the ages,
+which are small integers. Medians and percentiles come from the histogram.
+Each chunk is added with a few np.bincount calls, and the statistics of
+chunks or workers are combined with `merge`. Age 0 means a missing age: it
+is counted apart and left out of every statistic, as are the (invalid)
+negative ages.
+
+`QuantileSketch` gives approximate quantiles with a bounded relative error of
+continuous values, such as fields derived from the dates, and can be merged
+in the same way.
+"""
+import math
+from typing import Sequence
+
+import numpy as np
+
+from empleo import Categorical, EmploymentColumns
+
+# Initial number of age bins (ages 0 to 119); more are added if needed
+AGE_BINS = 120
+
+
+def _group_codes(data: EmploymentColumns, by: Sequence[str]) -> tuple[np.ndarray, list]:
+    '''
+    Group of every record and the label of each group: a value of the
+    column, or a tuple of values if there are several columns
+    '''
+    columns = [data[col] for col in by]
+    codes, labels = [], []
+    for col in columns:
+        if isinstance(col, Categorical):
+            codes.append(col.codes.astype(np.int64))
+            labels.append(col.categories)
+        else:
+            uniques, inverse = np.unique(np.asarray(col), return_inverse=True)
+            codes.append(inverse.reshape(-1))
+            labels.append(uniques)
+    if len(columns) == 1:
+        return codes[0], labels[0].tolist()
+    shape = [len(lab) for lab in labels]
+    used, inverse = np.unique(np.ravel_multi_index(codes, shape), return_inverse=True)
+    keys = zip(*[lab[c].tolist() for lab, c in zip(labels, np.unravel_index(used, shape))])
+    return inverse.reshape(-1), list(keys)
+
+
+class AgeStats:
+    '''
+    Count, mean, variance and histogram of the ages of every group
+    Args:
+        by (str | Sequence[str]): column or columns that define the groups
+    Examples:
+        >>> from empleo import parse_rows
+        >>> stats = AgeStats('DISTRITO_DESC')
+        >>> stats.update(parse_rows(['DISTRITO_DESC', 'EDAD'], [['CENTRO', '20'], ['LATINA', '30'],
+        ...                                                     ['CENTRO', '40'], ['LATINA', ''],
+        ...                                                     ['LATINA', '-5']]))
+        >>> stats.update(parse_rows(['DISTRITO_DESC', 'EDAD'], [['CENTRO', '30']]))
+        >>> stats.mean()
+        {'CENTRO': 30.0, 'LATINA': 30.0}
+        >>> stats.variance(ddof=1)['CENTRO']
+        100.0
+        >>> stats.quantile(0.5)['CENTRO'], stats.missing
+        (30, {'CENTRO': 0, 'LATINA': 2})
+    '''
+    def __init__(self, by: str | Sequence[str] = 'DISTRITO_DESC') -> None:
+        self.by = (by,) if isinstance(by, str) else tuple(by)
+        self.groups: dict = {}
+        self.n = np.zeros(0, dtype=np.int64)
+        self.means = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.missing_counts = np.zeros(0, dtype=np.int64)
+        self.histograms = np.zeros((0, AGE_BINS), dtype=np.int64)
+
+    def _resize(self, groups: int, bins: int) -> None:
+        old, old_bins = len(self.n), self.histograms.shape[1]
+        if groups == old and bins <= old_bins:
+            return
+        bins = max(bins, old_bins)
+        self.n = np.pad(self.n, (0, groups - old))
+        self.means = np.pad(self.means, (0, groups - old))
+        self.m2 = np.pad(self.m2, (0, groups - old))
+        self.missing_counts = np.pad(self.missing_counts, (0, groups - old))
+        self.histograms = np.pad(self.histograms, ((0, groups - old), (0, bins - old_bins)))
+
+    def _combine(self, index: np.ndarray, n: np.ndarray, means: np.ndarray, m2: np.ndarray) -> None:
+        # Parallel version of Welford's update: merges (n, mean, M2) of two sets
+        n_a, mean_a = self.n[index], self.means[index]
+        total = n_a + n
+        safe = np.maximum(total, 1)
+        delta = means - mean_a
+        self.means[index] = np.where(total > 0, mean_a + delta * n / safe, 0.0)
+        self.m2[index] = self.m2[index] + m2 + delta ** 2 * n_a * n / safe
+        self.n[index] = total
+
+    def _group_index(self, labels: list) -> np.ndarray:
+        return np.array([self.groups.setdefault(label, len(self.groups)) for label in labels],
+                        dtype=np.int64)
+
+    def update(self, data: EmploymentColumns) -> None:
+        '''
+        Adds the ages of a chunk of records, such as one of `empleo.iter_chunks`
+        '''
+        codes, labels = _group_codes(data, self.by)
+        ages = np.asarray(data['EDAD']).astype(np.int64)
+        index = self._group_index(labels)
+        g = len(labels)
+        self._resize(len(self.groups), int(ages.max()) + 1 if len(ages) else 0)
+        # Negative ages would fall in the bins of the previous group
+        known = ages > 0
+        kc, ka = codes[known], ages[known]
+        n = np.bincount(kc, minlength=g)
+        sums = np.bincount(kc, weights=ka, minlength=g)
+        means = np.divide(sums, n, out=np.zeros(g), where=n > 0)
+        m2 = np.bincount(kc, weights=(ka - means[kc]) ** 2, minlength=g)
+        self._combine(index, n, means, m2)
+        self.missing_counts[index] += np.bincount(codes[~known], minlength=g)
+        bins = self.histograms.shape[1]
+        hist = np.bincount(kc * bins + ka, minlength=g * bins).reshape(g, bins)
+        np.add.at(self.histograms, index, hist)
+
+    def merge(self, other: 'AgeStats') -> 'AgeStats':
+        '''
+        Adds the statistics of another AgeStats with the same groups columns
+        Args:
+            other (AgeStats): partial statistics, e.g. of another chunk or worker
+        Returns:
+            AgeStats: this object, updated
+        '''
+        labels = list(other.groups)
+        index = self._group_index(labels)
+        self._resize(len(self.groups), other.histograms.shape[1])
+        self._combine(index, other.n, other.means, other.m2)
+        self.missing_counts[index] += other.missing_counts
+        np.add.at(self.histograms, (index[:, None], np.arange(other.histograms.shape[1])), other.histograms)
+        return self
+
+    def _by_group(self, values, present: bool = True) -> dict:
+        return {label: values[i] for label, i in self.groups.items() if not present or self.n[i]}
+
+    @property
+    def missing(self) -> dict:
+        '''
+        Number of records with a missing age in each group
+        '''
+        return self._by_group(self.missing_counts.tolist(), present=False)
+
+    def count(self) -> dict:
+        '''
+        Number of known ages of each group
+        '''
+        return self._by_group(self.n.tolist())
+
+    def mean(self) -> dict:
+        '''
+        Mean age of each group with some known age
+        '''
+        return self._by_group(self.means.tolist())
+
+    def variance(self, ddof: int = 0) -> dict:
+        '''
+        Variance of the ages of each group (population variance by default)
+        '''
+        n = self.n - ddof
+        return self._by_group(np.divide(self.m2, n, out=np.full(len(n), math.nan), where=n > 0).tolist())
+
+    def std(self, ddof: int = 0) -> dict:
+        return {label: math.sqrt(v) for label, v in self.variance(ddof).items()}
+
+    def histogram(self, group) -> np.ndarray:
+        '''
+        Number of records of each age (0 to the maximum age) of a group, without missing ages
+        '''
+        return self.histograms[self.groups[group]].copy()
+
+    def quantile(self, q: float) -> dict:
+        '''
+        Age at quantile q (0 <= q <= 1) of each group, the smallest age with at
+        least that fraction of the group at or below it
+        '''
+        cumulative = np.cumsum(self.histograms, axis=1)
+        targets = np.maximum(np.ceil(q * self.n), 1)
+        ages = (cumulative < targets[:, None]).sum(axis=1)
+        return self._by_group(ages.tolist())
+
+    def median(self) -> dict:
+        return self.quantile(0.5)
+
+    def summary(self, quantiles: Sequence[float] = (0.25, 0.5, 0.75, 0.9)) -> dict:
+        '''
+        Count, missing, mean, standard deviation and some percentiles of each group
+        '''
+        stats = {"count": self.count(), "missing": self.missing, "mean": self.mean(), "std": self.std()}
+        stats.update({f"p{round(q * 100)}": self.quantile(q) for q in quantiles})
+        return {label: {name: values.get(label) for name, values in stats.items()} for label in self.groups}
+
+
+def age_stats(data: EmploymentColumns, by: str | Sequence[str] = 'DISTRITO_DESC') -> AgeStats:
+    '''
+    Age statistics of the records, grouped by some columns
+    Example:
+        >>> stats = age_stats(load_employment_columnar('inscritos.csv'), ['GENERO_DESC', 'NACIONALIDAD_DESC'])  # doctest: +SKIP
+        >>> stats.median()[('Mujer', 'Español')]  # doctest: +SKIP
+        44
+    '''
+    stats = AgeStats(by)
+    stats.update(data)
+    return stats
+
+
+class QuantileSketch:
+    '''
+    Approximate quantiles of positive values with relative error `alpha`:
+    values are counted in buckets whose bounds grow geometrically, so the
+    sketch is small and two sketches are merged by adding their buckets.
+    Zero and negative values are counted apart and reported as 0.
+    Args:
+        alpha (float): relative accuracy of the quantiles
+    Examples:
+        >>> sketch = QuantileSketch(0.01)
+        >>> sketch.update(np.arange(1, 1001))
+        >>> other = QuantileSketch(0.01)
+        >>> other.update(np.arange(1001, 2001))
+        >>> abs(sketch.merge(other).quantile(0.5) - 1000) < 20
+        True
+    '''
+    def __init__(self, alpha: float = 0.01) -> None:
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.buckets: dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+
+    def update(self, values) -> None:
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        positive = values[values > 0]
+        self.zeros += len(values) - len(positive)
+        self.count += len(values)
+        keys, counts = np.unique(np.ceil(np.log(positive) / math.log(self.gamma)).astype(np.int64),
+                                 return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        if other.alpha != self.alpha:
+            raise ValueError("Only sketches with the same accuracy can be merged")
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        return self
+
+    def quantile(self, q: float) -> float:
+        '''
+        Value at quantile q (0 <= q <= 1), within a relative error alpha
+        '''
+        if self.count == 0:
+            return math.nan
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
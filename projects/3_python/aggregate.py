@@ -0,0 +1,185 @@
+"""
+Single-pass aggregation of the employment data.
+
+`EmploymentAggregator` keeps the statistics of `people_by_district`,
+`mean_age_by_district` and `year_month_data` up to date while the CSV is
+read chunk by chunk, so the whole file never has to be in memory. Partial
+aggregators (for example, one per daily delta file) can be combined with
+`merge`.
+"""
+from typing import Iterable
+
+import numpy as np
+
+import empleo
+from empleo import EmploymentColumns
+
+
+class EmploymentAggregator:
+    '''
+    Incremental district and month statistics of employment records
+    Examples:
+        >>> agg = EmploymentAggregator()
+        >>> agg.update_rows([{'DISTRITO_DESC': ' LATINA', 'EDAD': '30', 'FECHA_INSCRIPCION': 'ene-24'},
+        ...                  {'DISTRITO_DESC': ' CENTRO', 'EDAD': '', 'FECHA_INSCRIPCION': 'feb-24'},
+        ...                  {'DISTRITO_DESC': ' LATINA', 'EDAD': '40', 'FECHA_INSCRIPCION': 'ene-24'}])
+        >>> agg.people_by_district()
+        [('LATINA', 2), ('CENTRO', 1)]
+        >>> agg.mean_age_by_district()
+        {'LATINA': 35.0}
+        >>> agg.year_month_data()
+        (array([[2, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]]), 2024)
+    '''
+    def __init__(self) -> None:
+        self.district_counts: dict[str, int] = {}
+        self.age_sums: dict[str, int] = {}
+        self.age_counts: dict[str, int] = {}
+        # Registrations per month, counted from 1970-01 + first_month
+        self.month_counts = np.zeros(0, dtype=np.int64)
+        self.first_month = 0
+
+    def __len__(self) -> int:
+        return sum(self.district_counts.values())
+
+    def _add_months(self, counts: np.ndarray, first: int) -> None:
+        if len(counts) == 0:
+            return
+        if len(self.month_counts) == 0:
+            self.month_counts, self.first_month = counts.astype(np.int64), first
+            return
+        lo = min(self.first_month, first)
+        hi = max(self.first_month + len(self.month_counts), first + len(counts))
+        merged = np.zeros(hi - lo, dtype=np.int64)
+        merged[self.first_month - lo:self.first_month - lo + len(self.month_counts)] += self.month_counts
+        merged[first - lo:first - lo + len(counts)] += counts
+        self.month_counts, self.first_month = merged, lo
+
+    def update(self, data: EmploymentColumns) -> None:
+        '''
+        Adds a chunk of columns, as returned by `empleo.iter_chunks`
+        Args:
+            data (EmploymentColumns): the records to add
+        Returns:
+            None
+        '''
+        districts = data['DISTRITO_DESC']
+        ages = np.asarray(data['EDAD'])
+        n = len(districts.categories)
+        # Age 0 means that the age is missing
+        known = ages != 0
+        counts = np.bincount(districts.codes, minlength=n)
+        age_sums = np.bincount(districts.codes[known], weights=ages[known], minlength=n)
+        age_counts = np.bincount(districts.codes[known], minlength=n)
+        for district, count, age_sum, age_count in zip(districts.categories, counts,
+                                                       age_sums, age_counts):
+            self.district_counts[district] = self.district_counts.get(district, 0) + int(count)
+            if age_count:
+                self.age_sums[district] = self.age_sums.get(district, 0) + int(age_sum)
+                self.age_counts[district] = self.age_counts.get(district, 0) + int(age_count)
+
+        months = np.asarray(data['FECHA_INSCRIPCION']).astype('datetime64[M]').astype(np.int64)
+        if len(months):
+            first = int(months.min())
+            self._add_months(np.bincount(months - first), first)
+
+    def update_rows(self, rows: Iterable[dict[str, str]],
+                    chunk_rows: int = empleo.CHUNK_ROWS) -> None:
+        '''
+        Adds records given as dictionaries, like the ones of a `csv.DictReader`
+        Args:
+            rows (Iterable[dict[str, str]]): the records to add, possibly a generator
+            chunk_rows (int): number of records converted at once
+        Returns:
+            None
+        '''
+        chunk = []
+        for row in rows:
+            chunk.append([row.get(col) or '' for col in empleo.COLUMNS])
+            if len(chunk) == chunk_rows:
+                self.update(empleo.parse_rows(empleo.COLUMNS, chunk))
+                chunk = []
+        if chunk:
+            self.update(empleo.parse_rows(empleo.COLUMNS, chunk))
+
+    def merge(self, other: 'EmploymentAggregator') -> 'EmploymentAggregator':
+        '''
+        Adds the statistics of another aggregator to this one
+        Args:
+            other (EmploymentAggregator): partial statistics, e.g. of a delta file
+        Returns:
+            EmploymentAggregator: this aggregator, updated
+        '''
+        for mine, theirs in [(self.district_counts, other.district_counts),
+                             (self.age_sums, other.age_sums),
+                             (self.age_counts, other.age_counts)]:
+            for key, value in theirs.items():
+                mine[key] = mine.get(key, 0) + value
+        self._add_months(other.month_counts, other.first_month)
+        return self
+
+    def to_dict(self) -> dict:
+        '''
+        The statistics as plain Python values, e.g. to store them as json
+        '''
+        return {"district_counts": dict(self.district_counts), "age_sums": dict(self.age_sums),
+                "age_counts": dict(self.age_counts), "month_counts": self.month_counts.tolist(),
+                "first_month": self.first_month}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'EmploymentAggregator':
+        '''
+        Aggregator with the statistics returned by `to_dict`
+        '''
+        agg = cls()
+        agg.district_counts = dict(state["district_counts"])
+        agg.age_sums = dict(state["age_sums"])
+        agg.age_counts = dict(state["age_counts"])
+        agg.month_counts = np.array(state["month_counts"], dtype=np.int64)
+        agg.first_month = int(state["first_month"])
+        return agg
+
+    def people_by_district(self) -> list[tuple[str, int]]:
+        '''
+        Districts and their number of records, sorted by number of records
+        '''
+        return sorted(self.district_counts.items(), key=lambda x: x[1], reverse=True)
+
+    def mean_age_by_district(self) -> dict[str, float]:
+        '''
+        Mean age of each district, ignoring missing ages
+        '''
+        return {district: self.age_sums[district] / count
+                for district, count in self.age_counts.items()}
+
+    def year_month_data(self) -> tuple[np.ndarray, int]:
+        '''
+        Matrix of registrations with a row per year and a column per month,
+        and the year of the first row
+        '''
+        used = np.flatnonzero(self.month_counts)
+        if len(used) == 0:
+            return np.zeros((0, 12), dtype=int), 0
+        first_year = (self.first_month + int(used[0])) // 12
+        last_year = (self.first_month + int(used[-1])) // 12
+        matrix = np.zeros((last_year - first_year + 1) * 12, dtype=int)
+        offset = self.first_month - first_year * 12
+        matrix[offset + used] = self.month_counts[used]
+        return matrix.reshape(-1, 12), 1970 + first_year
+
+
+def aggregate_csv(path: str, chunk_rows: int = empleo.CHUNK_ROWS) -> EmploymentAggregator:
+    '''
+    Computes the district and month statistics of a csv file in a single pass
+    Args:
+        path (str): path of the csv file
+        chunk_rows (int): number of rows held in memory at once
+    Returns:
+        EmploymentAggregator: the statistics of the file
+    Example:
+        >>> len(aggregate_csv("inscritos.csv"))  # doctest: +SKIP
+        150137
+    '''
+    agg = EmploymentAggregator()
+    for chunk in empleo.iter_chunks(path, chunk_rows):
+        agg.update(chunk)
+    return agg
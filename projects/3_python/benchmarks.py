@@ -0,0 +1,335 @@
+"""
+Benchmarks of the loading and aggregation functions on synthetic data.
+
+`gen_inscritos` writes files with the layout of inscritos.csv and any number
+of rows, so the functions of the notebooks and of the other modules can be
+timed at sizes well beyond the real export. `run_benchmarks` measures the
+wall time, the rows per second and the peak memory of every benchmark at
+each size, `save_results` stores them as json together with the versions
+and the machine, and `compare_results` lists the ones that got worse than
+a saved baseline (see `test_no_regressions` in `testing`).
+"""
+import csv
+import json
+import os
+import platform
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Sequence
+
+import numpy as np
+
+import empleo
+
+SIZES = [10_000, 150_000, 1_000_000, 10_000_000]
+DISTRICTS = {1: 'CENTRO', 2: 'ARGANZUELA', 3: 'RETIRO', 4: 'SALAMANCA', 5: 'CHAMARTÍN',
+             6: 'TETUÁN', 7: 'CHAMBERÍ', 8: 'FUENCARRAL-EL PARDO', 9: 'MONCLOA-ARAVACA',
+             10: 'LATINA', 11: 'CARABANCHEL', 12: 'USERA', 13: 'PUENTE DE VALLECAS',
+             14: 'MORATALAZ', 15: 'CIUDAD LINEAL', 16: 'HORTALEZA', 17: 'VILLAVERDE',
+             18: 'VILLA DE VALLECAS', 19: 'VICÁLVARO', 20: 'SAN BLAS - CANILLEJAS',
+             21: 'BARAJAS', 22: 'OTRO MUNICIPIO'}
+OCCUPATIONS = {3510: 'Agentes y representantes comerciales',
+               5220: 'Vendedores en tiendas y almacenes',
+               5420: 'Operadores de telemarketing',
+               5500: 'Cajeros y taquilleros (excepto bancos)',
+               5811: 'Peluqueros',
+               5833: 'Conserjes de edificios',
+               7121: 'Albañiles',
+               7703: 'Panaderos, pasteleros y confiteros',
+               9100: 'Empleados domésticos',
+               9210: 'Personal de limpieza de oficinas, hoteles y otros establecimientos similares',
+               9443: 'Barrenderos y afines',
+               9512: 'Peones agrícolas en huertas, invernaderos, viveros y jardines',
+               9602: 'Peones de la construcción de edificios',
+               9700: 'Peones de las industrias manufactureras',
+               9811: 'Peones del transporte de mercancías y descargadores',
+               9820: 'Reponedores'}
+NATIONALITIES = ['Español', 'Extracomunitario', 'Comunitario']
+
+
+def gen_inscritos(path: str, rows: int, seed: int = 42, chunk_rows: int = 100_000) -> None:
+    '''
+    Writes a synthetic employment csv with the same layout as inscritos.csv:
+    BOM, ';' separator, quoted text and descriptions of districts with a
+    leading space. About 8% of the professional objectives and 0.2% of the
+    ages are missing.
+    Args:
+        path (str): file to write
+        rows (int): number of records
+        seed (int): seed of the random generator, so the files are reproducible
+        chunk_rows (int): records generated and written at a time
+    Returns:
+        None
+    Example:
+        >>> gen_inscritos('bench_data/inscritos_1000.csv', 1000)  # doctest: +SKIP
+    '''
+    rng = np.random.default_rng(seed)
+    header = ';'.join(empleo.COLUMNS)
+    districts = [(str(cod), f'" {desc}"') for cod, desc in DISTRICTS.items()]
+    occupations = [(f'"{cod}"', f'"{desc}"') for cod, desc in OCCUPATIONS.items()] + [('""', '""')]
+    months = [f'"{m}-{y:02d}"' for y in range(17, 26) for m in empleo.MONTHS]
+    genders = ['"Hombre"', '"Mujer"']
+    nationalities = [f'"{n}"' for n in NATIONALITIES]
+    fx_carga = '"2025-08-07 00:11:57.897"'
+    occ_p = np.full(len(occupations), 0.92 / (len(occupations) - 1))
+    occ_p[-1] = 0.08
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        f.write(header + '\n')
+        for start in range(0, rows, chunk_rows):
+            n = min(chunk_rows, rows - start)
+            month = rng.integers(0, len(months), n)
+            gender = rng.integers(0, 2, n)
+            district = rng.integers(0, len(districts), n)
+            age = rng.integers(16, 67, n)
+            age[rng.random(n) < 0.002] = 0
+            nationality = rng.integers(0, len(nationalities), n)
+            objs = rng.choice(len(occupations), size=(3, n), p=occ_p)
+            lines = []
+            for i in range(n):
+                cod, desc = districts[district[i]]
+                o1, o2, o3 = occupations[objs[0, i]], occupations[objs[1, i]], occupations[objs[2, i]]
+                lines.append(f'{months[month[i]]};{genders[gender[i]]};{cod};{desc};'
+                             f'{age[i] or ""};{nationalities[nationality[i]]};'
+                             f'{o1[0]};{o1[1]};{o2[0]};{o2[1]};{o3[0]};{o3[1]};{fx_carga}\n')
+            f.write(''.join(lines))
+
+
+def bench_data(rows: int, data_dir: str = 'bench_data') -> str:
+    '''
+    Path of the synthetic file with some number of rows, generated the first time
+    Args:
+        rows (int): number of records
+        data_dir (str): folder of the generated files
+    Returns:
+        str: path of the file
+    '''
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f'inscritos_{rows}.csv')
+    if not os.path.exists(path):
+        gen_inscritos(path, rows)
+    return path
+
+
+def measure(fun: Callable, *args, rows: int = 0, memory: bool = True) -> dict:
+    '''
+    Wall time, rows per second and peak memory of a single call. With
+    memory=True the call runs under tracemalloc, so its side effects happen
+    once and the time and the peak memory are of the same run; the time then
+    includes the cost of tracing the allocations, so compare it only with
+    other runs with memory=True.
+    Args:
+        fun (Callable): function to measure
+        *args: its arguments
+        rows (int): records processed by the call, for the rows per second
+        memory (bool): whether to measure the peak memory as well
+    Returns:
+        dict: "wall_s", "rows", "rows_per_s" and, with memory=True, "peak_mb"
+    Examples:
+        >>> res = measure(sorted, list(range(1000)), rows=1000)
+        >>> sorted(res)
+        ['peak_mb', 'rows', 'rows_per_s', 'wall_s']
+    '''
+    if memory:
+        tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        fun(*args)
+        wall = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if memory else 0
+    finally:
+        if memory:
+            tracemalloc.stop()
+    result = {"wall_s": wall, "rows": rows, "rows_per_s": rows / wall if wall else 0.0}
+    if memory:
+        result["peak_mb"] = peak / 2**20
+    return result
+
+
+def _rows(path):
+    with open(path, 'rb') as f:
+        return sum(block.count(b'\n') for block in iter(lambda: f.read(1 << 20), b'')) - 1
+
+
+def bench_load_employment(load_employment: Callable, path: str) -> dict:
+    '''
+    Measures the load of a file into memory, e.g. with `load_employment` or
+    `empleo.load_employment_columnar`
+    Args:
+        load_employment (Callable): loader of a csv file
+        path (str): the csv file
+    Returns:
+        dict: the measures of `measure`
+    Example:
+        >>> sorted(bench_load_employment(load_employment, bench_data(150_000)))  # doctest: +SKIP
+        ['peak_mb', 'rows', 'rows_per_s', 'wall_s']
+    '''
+    return measure(load_employment, path, rows=_rows(path))
+
+
+def bench_people_by_district(people_by_district: Callable, load_employment: Callable, path: str) -> dict:
+    '''
+    Measures `people_by_district` on the records of a file (the load is not measured)
+    '''
+    return measure(people_by_district, load_employment(path), rows=_rows(path))
+
+
+def bench_mean_age_by_district(mean_age_by_district: Callable, load_employment: Callable, path: str) -> dict:
+    '''
+    Measures `mean_age_by_district` on the records of a file (the load is not measured)
+    '''
+    return measure(mean_age_by_district, load_employment(path), rows=_rows(path))
+
+
+def bench_year_month_data(year_month_data: Callable, load_employment: Callable, path: str) -> dict:
+    '''
+    Measures `year_month_data` on the records of a file (the load is not measured)
+    '''
+    return measure(year_month_data, load_employment(path), rows=_rows(path))
+
+
+def bench_gen_sample(gen_sample: Callable, path: str) -> dict:
+    '''
+    Measures the generation of a 5% sample of a file
+    '''
+    return measure(gen_sample, path, 0.05, rows=_rows(path))
+
+
+def bench_load_dataframe(load_dataframe: Callable, path: str) -> dict:
+    '''
+    Measures the load of a file into a DataFrame
+    '''
+    return measure(load_dataframe, path, rows=_rows(path))
+
+
+def bench_by_month(by_month: Callable, filter_year: Callable, load_dataframe: Callable, path: str) -> dict:
+    '''
+    Measures `by_month` on the records of 2022 of a file (the load and the
+    filter are not measured)
+    '''
+    data = filter_year(load_dataframe(path), 2022)
+    return measure(by_month, data, rows=len(data))
+
+
+def run_benchmarks(benchmarks: dict[str, Callable], sizes: Sequence[int] = SIZES,
+                   data_dir: str = 'bench_data') -> dict:
+    '''
+    Runs some benchmarks on synthetic files of several sizes
+    Args:
+        benchmarks (dict[str, Callable]): functions that take the path of a data
+            file and return the measures of `measure`, by name
+        sizes (Sequence[int]): numbers of records of the files
+        data_dir (str): folder of the generated files
+    Returns:
+        dict: the measures by benchmark name and number of rows (as a str)
+    Example:
+        >>> results = run_benchmarks({'load_employment':
+        ...                           lambda path: bench_load_employment(load_employment, path)},
+        ...                          sizes=[10_000])  # doctest: +SKIP
+        >>> save_results(results)  # doctest: +SKIP
+    '''
+    results = {}
+    for rows in sizes:
+        path = bench_data(rows, data_dir)
+        for name, bench in benchmarks.items():
+            res = bench(path)
+            results.setdefault(name, {})[str(rows)] = res
+            print(f"{name:<25s}{rows:>10d} rows {res['wall_s']:9.3f}s "
+                  f"{res['rows_per_s']:12.0f} rows/s {res.get('peak_mb', float('nan')):9.1f} MB")
+    return results
+
+
+def save_results(results: dict, path: str = 'bench_results.json') -> dict:
+    '''
+    Stores the results of `run_benchmarks` as json, with the date, the
+    versions of Python and numpy and the machine they were measured on
+    Returns:
+        dict: the stored report
+    '''
+    report = {"date": datetime.now().isoformat(timespec='seconds'),
+              "python": platform.python_version(),
+              "numpy": np.__version__,
+              "machine": platform.platform(),
+              "results": results}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def load_results(path: str = 'bench_results.json') -> dict:
+    '''
+    The results stored by `save_results`
+    '''
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)["results"]
+
+
+def compare_results(results: dict, baseline: dict, threshold: float = 0.2,
+                    min_wall: float = 0.01) -> list[tuple[str, int, str, float, float]]:
+    '''
+    Benchmarks whose time or memory grew more than `threshold` over a baseline.
+    Times shorter than `min_wall` seconds are too noisy to be compared.
+    Args:
+        results (dict): results of `run_benchmarks`
+        baseline (dict): earlier results, e.g. of `load_results`
+        threshold (float): relative growth allowed
+        min_wall (float): shortest time compared, in seconds
+    Returns:
+        list[tuple[str, int, str, float, float]]: name, rows, metric and the
+            values before and after of each regression
+    Examples:
+        >>> base = {'load': {'1000': {'wall_s': 1.0, 'peak_mb': 10.0}}}
+        >>> compare_results({'load': {'1000': {'wall_s': 1.5, 'peak_mb': 10.5}}}, base)
+        [('load', 1000, 'wall_s', 1.0, 1.5)]
+    '''
+    regressions = []
+    for name, by_size in results.items():
+        for rows, res in by_size.items():
+            base = baseline.get(name, {}).get(rows)
+            if base is None:
+                continue
+            for metric in ("wall_s", "peak_mb"):
+                if metric == "wall_s" and max(res[metric], base.get(metric, 0)) < min_wall:
+                    continue
+                if metric in res and base.get(metric) and res[metric] > base[metric] * (1 + threshold):
+                    regressions.append((name, int(rows), metric, base[metric], res[metric]))
+    return regressions
+
+
+def _read_column(path: str, column: str) -> list[str]:
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        return [row[column].strip() for row in csv.DictReader(f, delimiter=';')]
+
+
+def bench_parsers(str2int: Callable, str2dt: Callable, str2my: Callable,
+                  path: str = 'inscritos.csv') -> dict:
+    '''
+    Checks that the batch parsers of `empleo` give the same values as the
+    scalar ones and measures both on the columns of a file
+    Args:
+        str2int (Callable): scalar parser of the ages
+        str2dt (Callable): scalar parser of FX_CARGA
+        str2my (Callable): scalar parser of FECHA_INSCRIPCION
+        path (str): the csv file
+    Returns:
+        dict: the measures of `measure` of the scalar and the batch parser, by column
+    Example:
+        >>> results = bench_parsers(str2int, str2dt, str2my, bench_data(150_000))  # doctest: +SKIP
+    '''
+    results = {}
+    cases = [("EDAD", str2int, empleo.str2int_batch),
+             ("FX_CARGA", str2dt, empleo.str2dt_batch),
+             ("FECHA_INSCRIPCION", str2my, empleo.str2my_batch)]
+    for column, scalar, batch in cases:
+        values = _read_column(path, column)
+        actual = batch(values)
+        if np.issubdtype(actual.dtype, np.datetime64):
+            actual = actual.astype('datetime64[us]')
+        assert actual.tolist() == [scalar(s) for s in values], f"{batch.__name__} does not match {scalar.__name__}"
+        res = {"scalar": measure(lambda v: [scalar(s) for s in v], values, rows=len(values), memory=False),
+               "batch": measure(batch, values, rows=len(values), memory=False)}
+        results[column] = res
+        print(f"{column:<20s}{scalar.__name__:>10s} {res['scalar']['wall_s']:8.3f}s"
+              f"{batch.__name__:>16s} {res['batch']['wall_s']:8.3f}s"
+              f"  x{res['scalar']['wall_s'] / res['batch']['wall_s']:6.1f}")
+    return results
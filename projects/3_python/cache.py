@@ -0,0 +1,216 @@
+"""
+On-disk cache of parsed employment files.
+
+The columns returned by `empleo.load_employment_columnar` are stored as one
+.npy file per column (the codes, for dictionary-encoded columns) and a
+meta.json file with the vocabularies and the identity of the source csv.
+Later loads memory-map the .npy files, so no data is copied nor any Python
+object created per row.
+
+The cache is invalidated when the csv is another file (another absolute
+path), when its size changes or when its modification time changes and its
+content hash does not match.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import empleo
+from empleo import Categorical, DateColumn, EmploymentColumns
+
+CACHE_VERSION = 2
+
+
+def cache_dir_for(path: str) -> str:
+    '''
+    Default cache directory of a csv file: the file name plus '.cache'
+    Examples:
+        >>> cache_dir_for('data/inscritos.csv')
+        'data/inscritos.csv.cache'
+    '''
+    return path + '.cache'
+
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    '''
+    BLAKE2b hash of the content of a file
+    '''
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_info(path: str) -> dict:
+    '''
+    Absolute path, size and modification time of a file, as stored in the
+    metadata of the caches and checked by `read_meta`
+    '''
+    stat = os.stat(path)
+    return {"source": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def write_columns(data: EmploymentColumns, folder: str) -> dict:
+    '''
+    Writes the columns as .npy files in a folder
+    Args:
+        data (EmploymentColumns): the columns
+        folder (str): an existing folder
+    Returns:
+        dict: the kind of each column under "columns" and the vocabularies of
+            the dictionary-encoded ones under "categories", for `read_columns`
+    '''
+    meta = {"columns": {}, "categories": {}}
+    for col, values in data.items():
+        if isinstance(values, Categorical):
+            meta["columns"][col] = "category"
+            meta["categories"][col] = values.categories.tolist()
+            values = values.codes
+        elif isinstance(values, DateColumn):
+            meta["columns"][col] = "date"
+            values = values.values
+        else:
+            meta["columns"][col] = "int"
+        np.save(os.path.join(folder, f"{col}.npy"), np.ascontiguousarray(values))
+    return meta
+
+
+def save_cache(data: EmploymentColumns, path: str, cache_dir: str | None = None) -> None:
+    '''
+    Stores the parsed columns of a csv file in its cache directory
+    Args:
+        data (EmploymentColumns): the columns loaded from `path`
+        path (str): path of the csv file the columns come from
+        cache_dir (str): cache directory, by default the one of `cache_dir_for`
+    Returns:
+        None
+    '''
+    cache_dir = cache_dir or cache_dir_for(path)
+    meta = {"version": CACHE_VERSION, **source_info(path), "blake2b": file_hash(path)}
+    parent = os.path.dirname(os.path.abspath(cache_dir))
+    tmp = tempfile.mkdtemp(prefix='.tmp-', dir=parent)
+    try:
+        meta.update(write_columns(data, tmp))
+        with open(os.path.join(tmp, "meta.json"), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        # Replace the old cache only once the new one is complete
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.replace(tmp, cache_dir)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def read_meta(path: str, cache_dir: str, filename: str = "meta.json",
+              version: int = CACHE_VERSION) -> dict | None:
+    '''
+    Metadata of a store derived from a csv file (this cache, the partitions,
+    the aggregates...) if it is still valid for the file, or None
+    Args:
+        path (str): path of the csv file
+        cache_dir (str): directory of the store
+        filename (str): json file of the metadata in that directory
+        version (int): current version of the format of the store
+    Returns:
+        dict | None: the metadata, or None if it is missing, of another
+            version or of another content of the file
+    '''
+    try:
+        with open(os.path.join(cache_dir, filename), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    info = source_info(path)
+    # A cache copied next to another csv is not reused, even with the same content
+    if meta.get("version") != version or meta.get("source") != info["source"] \
+            or meta.get("size") != info["size"]:
+        return None
+    if meta.get("mtime_ns") != info["mtime_ns"]:
+        # The file was touched: only the content tells whether it changed
+        if meta.get("blake2b") != file_hash(path):
+            return None
+        meta["mtime_ns"] = info["mtime_ns"]
+        with open(os.path.join(cache_dir, filename), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+    return meta
+
+
+def load_array(filename: str) -> np.ndarray:
+    '''
+    Memory-maps a .npy file (empty arrays are read)
+    '''
+    try:
+        return np.load(filename, mmap_mode='r')
+    except ValueError:
+        # Empty arrays cannot be memory-mapped
+        return np.load(filename)
+
+
+def read_columns(folder: str, meta: dict) -> EmploymentColumns:
+    '''
+    Memory-maps the columns written by `write_columns`
+    Args:
+        folder (str): the folder of the .npy files
+        meta (dict): the kinds and vocabularies returned by `write_columns`
+    Returns:
+        EmploymentColumns: the columns
+    '''
+    data = {}
+    vocabularies: dict[tuple, np.ndarray] = {}
+    for col, kind in meta["columns"].items():
+        values = load_array(os.path.join(folder, f"{col}.npy"))
+        if kind == "category":
+            # Columns that shared a vocabulary share it again
+            key = tuple(meta["categories"][col])
+            if key not in vocabularies:
+                vocabularies[key] = np.array(key, dtype=object)
+            data[col] = Categorical(values, vocabularies[key])
+        elif kind == "date":
+            data[col] = DateColumn(values)
+        else:
+            data[col] = values
+    return data
+
+
+def load_cache(path: str, cache_dir: str | None = None) -> EmploymentColumns | None:
+    '''
+    Memory-maps the cached columns of a csv file
+    Args:
+        path (str): path of the csv file
+        cache_dir (str): cache directory, by default the one of `cache_dir_for`
+    Returns:
+        EmploymentColumns: the cached columns, or None if there is no valid cache
+    '''
+    cache_dir = cache_dir or cache_dir_for(path)
+    meta = read_meta(path, cache_dir)
+    if meta is None:
+        return None
+    return read_columns(cache_dir, meta)
+
+
+def load_employment_cached(path: str, cache_dir: str | None = None,
+                           workers: int = 1) -> EmploymentColumns:
+    '''
+    Loads an employment csv into columns, parsing it only if its cache is
+    missing or out of date
+    Args:
+        path (str): path of the csv file
+        cache_dir (str): cache directory, by default the one of `cache_dir_for`
+        workers (int): number of processes used if the file has to be parsed
+    Returns:
+        EmploymentColumns: a dictionary of columns populated from the csv
+    Example:
+        >>> data = load_employment_cached("inscritos.csv")  # doctest: +SKIP
+        >>> len(data['EDAD'])                               # doctest: +SKIP
+        150137
+    '''
+    data = load_cache(path, cache_dir)
+    if data is None:
+        save_cache(empleo.load_employment_columnar(path, workers), path, cache_dir)
+        data = load_cache(path, cache_dir)
+    return data
@@ -0,0 +1,272 @@
+"""
+Counting cube of employment records over any combination of dimensions.
+
+The records are counted once with `np.bincount` over the flattened index of
+their coordinates. Pivots such as the year x month matrix of
+`year_month_data`, the sums of `sum_by_month_year` or the quarters of
+`by_quarters` are then reductions of the cube along some of its axes, so
+they do not need another pass over the records.
+
+Cubes with many cells (for example over OBJETIVOPROFESIONAL1_COD) are kept
+sparse: only the flat indices of the non empty cells and their counts.
+"""
+from math import prod
+from typing import Sequence
+
+import numpy as np
+
+import empleo
+from empleo import Categorical
+
+MONTHS = empleo.MONTHS
+QUARTERS = ['T1', 'T2', 'T3', 'T4']
+AGE_BUCKETS = ['missing', '<25', '25-34', '35-44', '45-54', '55-64', '65+']
+_AGE_EDGES = [1, 25, 35, 45, 55, 65]
+# Cubes with more cells than this are stored as sparse by default
+SPARSE_CELLS = 1_000_000
+
+
+def _months(data) -> np.ndarray:
+    '''
+    Months since 1970-01 of the registration date of every record
+    '''
+    return np.asarray(data['FECHA_INSCRIPCION']).astype('datetime64[M]').astype(np.int64)
+
+
+def dimension(data, dim: str) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Coordinates of every record along a dimension and the labels of the
+    dimension. Besides the columns of the data, the dimensions 'year',
+    'month', 'quarter' and 'age_bucket' are derived from the dates and ages.
+    Args:
+        data (EmploymentColumns): the records
+        dim (str): name of the dimension
+    Returns:
+        tuple[np.ndarray, np.ndarray]: the coordinates and the labels
+    Examples:
+        >>> data = {'EDAD': np.array([0, 30, 70]),
+        ...         'FECHA_INSCRIPCION': np.array(['2023-05', '2025-01', '2025-12'], dtype='datetime64[M]')}
+        >>> dimension(data, 'year')
+        (array([0, 2, 2]), array([2023, 2024, 2025]))
+        >>> dimension(data, 'age_bucket')[0]
+        array([0, 2, 6])
+    '''
+    if dim in ('year', 'month', 'quarter'):
+        months = _months(data)
+        if dim == 'month':
+            return months % 12, np.array(MONTHS, dtype=object)
+        if dim == 'quarter':
+            return months % 12 // 3, np.array(QUARTERS, dtype=object)
+        years = months // 12 + 1970
+        first = int(years.min()) if len(years) else 1970
+        last = int(years.max()) if len(years) else first - 1
+        return years - first, np.arange(first, last + 1)
+    if dim == 'age_bucket':
+        return np.digitize(np.asarray(data['EDAD']), _AGE_EDGES), np.array(AGE_BUCKETS, dtype=object)
+    column = data[dim]
+    if isinstance(column, Categorical):
+        return column.codes.astype(np.int64), column.categories
+    labels, codes = np.unique(np.asarray(column), return_inverse=True)
+    return codes.reshape(-1), labels
+
+
+class CountCube:
+    '''
+    Number of records for every combination of the labels of some dimensions
+    Args:
+        dims (Sequence[str]): names of the dimensions
+        labels (Sequence[np.ndarray]): labels of each dimension
+        counts (np.ndarray): dense array of counts, with an axis per dimension
+        cells (tuple[np.ndarray, np.ndarray]): flat indices and counts of the
+            non empty cells, for sparse cubes
+    '''
+    def __init__(self, dims: Sequence[str], labels: Sequence[np.ndarray],
+                 counts: np.ndarray | None = None,
+                 cells: tuple[np.ndarray, np.ndarray] | None = None) -> None:
+        self.dims = tuple(dims)
+        self.labels = [np.asarray(lab) for lab in labels]
+        self.shape = tuple(len(lab) for lab in self.labels)
+        self.counts = counts
+        self.cells = cells
+
+    @classmethod
+    def from_coords(cls, dims: Sequence[str], labels: Sequence[np.ndarray],
+                    coords: Sequence[np.ndarray], weights: np.ndarray | None = None,
+                    sparse: bool | None = None) -> 'CountCube':
+        '''
+        Counts (or adds the weights of) the records with the given coordinates
+        '''
+        shape = tuple(len(lab) for lab in labels)
+        if sparse is None:
+            sparse = prod(shape) > SPARSE_CELLS
+        if len(dims) == 0:
+            total = np.sum(weights) if weights is not None else len(coords[0]) if coords else 0
+            return cls(dims, labels, counts=np.array(total, dtype=np.int64))
+        flat = np.ravel_multi_index(tuple(coords), shape) if len(coords[0]) else np.zeros(0, dtype=np.int64)
+        if not sparse:
+            counts = np.bincount(flat, weights=weights, minlength=prod(shape))
+            return cls(dims, labels, counts=counts.astype(np.int64).reshape(shape))
+        index, inverse = np.unique(flat, return_inverse=True)
+        counts = np.bincount(inverse.reshape(-1), weights=weights, minlength=len(index))
+        return cls(dims, labels, cells=(index.astype(np.int64), counts.astype(np.int64)))
+
+    @property
+    def sparse(self) -> bool:
+        return self.counts is None
+
+    def _coords(self) -> tuple[list[np.ndarray], np.ndarray]:
+        '''
+        Coordinates and counts of the non empty cells
+        '''
+        if self.sparse:
+            index, counts = self.cells
+        else:
+            flat = self.counts.reshape(-1)
+            index = np.flatnonzero(flat)
+            counts = flat[index]
+        return list(np.unravel_index(index, self.shape)), counts
+
+    def to_array(self) -> np.ndarray:
+        '''
+        Dense array of counts, with an axis per dimension
+        '''
+        if not self.sparse:
+            return self.counts
+        dense = np.zeros(prod(self.shape), dtype=np.int64)
+        dense[self.cells[0]] = self.cells[1]
+        return dense.reshape(self.shape)
+
+    def total(self) -> int:
+        return int(self.cells[1].sum() if self.sparse else self.counts.sum())
+
+    def sum(self, *keep: str) -> 'CountCube':
+        '''
+        Roll-up of the cube: sums over every dimension not in `keep`
+        Args:
+            keep (str): dimensions of the result, in the wanted order
+        Returns:
+            CountCube: a cube with only the kept dimensions
+        Examples:
+            >>> cube = CountCube.from_coords(['year', 'month'], [np.arange(2020, 2022), np.arange(12)],
+            ...                              [np.array([0, 0, 1]), np.array([3, 3, 5])])
+            >>> cube.sum('year').to_array()
+            array([2, 1])
+        '''
+        axes = [self.dims.index(d) for d in keep]
+        labels = [self.labels[a] for a in axes]
+        if not self.sparse:
+            others = tuple(a for a in range(len(self.dims)) if a not in axes)
+            reduced = self.counts.sum(axis=others)
+            # sum() leaves the kept axes in their original order
+            order = np.argsort(np.argsort(axes))
+            return CountCube(keep, labels, counts=np.transpose(reduced, order) if keep else reduced)
+        coords, counts = self._coords()
+        return CountCube.from_coords(keep, labels, [coords[a] for a in axes], weights=counts)
+
+    def select(self, **where) -> 'CountCube':
+        '''
+        Slice of the cube for a label of some dimensions, which are removed
+        Examples:
+            >>> cube = CountCube.from_coords(['year', 'month'], [np.arange(2020, 2022), np.arange(12)],
+            ...                              [np.array([0, 0, 1]), np.array([3, 3, 5])])
+            >>> cube.select(year=2020).to_array()
+            array([0, 0, 0, 2, 0, 0, 0, 0, 0, 0, 0, 0])
+        '''
+        positions = {self.dims.index(d): int(np.flatnonzero(self.labels[self.dims.index(d)] == label)[0])
+                     for d, label in where.items()}
+        keep = [a for a in range(len(self.dims)) if a not in positions]
+        dims, labels = [self.dims[a] for a in keep], [self.labels[a] for a in keep]
+        if not self.sparse:
+            index = tuple(positions.get(a, slice(None)) for a in range(len(self.dims)))
+            return CountCube(dims, labels, counts=self.counts[index])
+        coords, counts = self._coords()
+        mask = np.ones(len(counts), dtype=bool)
+        for axis, pos in positions.items():
+            mask &= coords[axis] == pos
+        return CountCube.from_coords(dims, labels, [coords[a][mask] for a in keep],
+                                     weights=counts[mask], sparse=True)
+
+    def regroup(self, dim: str, groups: np.ndarray, labels: Sequence, name: str) -> 'CountCube':
+        '''
+        Merges the labels of a dimension into coarser groups, e.g. months into quarters
+        Args:
+            dim (str): dimension to regroup
+            groups (np.ndarray): group of each label of the dimension
+            labels (Sequence): labels of the groups
+            name (str): name of the new dimension
+        Returns:
+            CountCube: a cube with the new dimension in place of the old one
+        '''
+        axis = self.dims.index(dim)
+        dims = self.dims[:axis] + (name,) + self.dims[axis + 1:]
+        new_labels = self.labels[:axis] + [np.asarray(labels)] + self.labels[axis + 1:]
+        groups = np.asarray(groups)
+        if not self.sparse:
+            moved = np.moveaxis(self.counts, axis, 0)
+            out = np.zeros((len(labels),) + moved.shape[1:], dtype=np.int64)
+            np.add.at(out, groups, moved)
+            return CountCube(dims, new_labels, counts=np.moveaxis(out, 0, axis))
+        coords, counts = self._coords()
+        coords[axis] = groups[coords[axis]]
+        return CountCube.from_coords(dims, new_labels, coords, weights=counts, sparse=True)
+
+    def to_dict(self) -> dict[tuple, int]:
+        '''
+        Count of every non empty cell, keyed by its labels
+        '''
+        coords, counts = self._coords()
+        keys = zip(*[lab[c].tolist() for lab, c in zip(self.labels, coords)])
+        return dict(zip(keys, counts.tolist()))
+
+
+def build_cube(data, dims: Sequence[str], sparse: bool | None = None) -> CountCube:
+    '''
+    Counts the records of every combination of labels of some dimensions
+    Args:
+        data (EmploymentColumns): the records
+        dims (Sequence[str]): names of the dimensions, see `dimension`
+        sparse (bool): whether to store only the non empty cells; by default
+            only cubes with more than SPARSE_CELLS cells are sparse
+    Returns:
+        CountCube: the counts
+    Examples:
+        >>> data = {'FECHA_INSCRIPCION': np.array(['2023-01', '2023-03', '2024-01', '2024-01'],
+        ...                                       dtype='datetime64[M]')}
+        >>> build_cube(data, ['year', 'month']).to_array()
+        array([[1, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+               [2, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]])
+    '''
+    coords, labels = zip(*[dimension(data, d) for d in dims]) if dims else ((), ())
+    return CountCube.from_coords(dims, labels, coords, sparse=sparse)
+
+
+def year_month_data(data) -> tuple[np.ndarray, int]:
+    '''
+    Matrix of registrations per year (rows) and month (columns), and the
+    first year, counted with a single bincount
+    '''
+    cube = build_cube(data, ['year', 'month'])
+    return cube.to_array(), int(cube.labels[0][0]) if len(cube.labels[0]) else 0
+
+
+def sum_by_month_year(matrix: np.array) -> tuple[np.array, np.array]:
+    '''
+    Sums of a year x month matrix by month and by year
+    Examples:
+        >>> sum_by_month_year(np.array([[1, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+        ...                             [2, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]]))
+        (array([3, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0]), array([2, 2]))
+    '''
+    cube = CountCube(['year', 'month'], [np.arange(len(matrix)), np.array(MONTHS)], counts=matrix)
+    return cube.sum('month').to_array(), cube.sum('year').to_array()
+
+
+def by_quarters(matrix: np.array) -> np.array:
+    '''
+    Regroups the months of a year x month matrix into quarters
+    Examples:
+        >>> by_quarters(np.array([[1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]]))
+        array([[ 6, 15, 24, 33]])
+    '''
+    cube = CountCube(['year', 'month'], [np.arange(len(matrix)), np.array(MONTHS)], counts=matrix)
+    return cube.regroup('month', np.arange(12) // 3, QUARTERS, 'quarter').to_array()
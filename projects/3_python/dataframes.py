@@ -0,0 +1,171 @@
+"""
+Loading of the employment CSV files into pandas DataFrames, as done in
+02_pandas (`load_dataframe`), with a parallel mode for large exports
+(`load_dataframe_parallel`).
+
+`load_columns` loads only some columns and does not tokenize the others:
+the projection is passed to the reader as `usecols`, the pyarrow engine is
+used if it is installed and the descriptions are loaded as categories.
+"""
+import io
+from concurrent.futures import ProcessPoolExecutor
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+import empleo
+
+try:
+    import pyarrow  # noqa: F401
+    ENGINE = 'pyarrow'
+except ImportError:
+    ENGINE = 'c'
+
+DataFrame = pd.core.frame.DataFrame
+DERIVED_COLUMNS = ['MES_INSCRIPCION', 'ANYO_INSCRIPCION']
+# The columns kept by reduce_cols in 02_pandas
+REDUCED_COLUMNS = ['FECHA_INSCRIPCION', 'GENERO_DESC', 'DISTRITO_COD', 'DISTRITO_DESC', 'EDAD',
+                   'NACIONALIDAD_DESC', 'FX_CARGA', 'MES_INSCRIPCION', 'ANYO_INSCRIPCION']
+
+
+def _year_numbers(years: pd.Series) -> pd.Series:
+    '''
+    Years of the dates as integers; missing or wrong years become 0, as in `empleo`
+    '''
+    return pd.to_numeric(years, errors='coerce').fillna(0).astype(int)
+
+
+def _add_columns(data: DataFrame) -> DataFrame:
+    '''
+    Strips the district descriptions and adds MES_INSCRIPCION and
+    ANYO_INSCRIPCION from FECHA_INSCRIPCION ('ene-24' -> 'ene', 24)
+    '''
+    data['DISTRITO_DESC'] = data['DISTRITO_DESC'].str.strip()
+    month_year = data['FECHA_INSCRIPCION'].astype(object).str.split('-')
+    data['MES_INSCRIPCION'] = month_year.str[0]
+    data['ANYO_INSCRIPCION'] = _year_numbers(month_year.str[1])
+    return data
+
+
+def _month_year(dates: pd.Series) -> tuple[pd.Series, pd.Series]:
+    '''
+    Month and year of each 'ene-24' date, splitting only the distinct dates
+    Examples:
+        >>> month, year = _month_year(pd.Series(['ene-24', 'feb-23', None, 'ene-24']))
+        >>> month.tolist(), year.tolist()
+        (['ene', 'feb', nan, 'ene'], [24, 23, 0, 24])
+    '''
+    codes, uniques = pd.factorize(dates)
+    parts = pd.Series(uniques, dtype=object).str.split('-', n=1, expand=True).reindex(columns=[0, 1])
+    # Missing dates have code -1, which picks the value appended at the end
+    months = np.append(parts[0].to_numpy(dtype=object), np.nan)[codes]
+    years = np.append(_year_numbers(parts[1]).to_numpy(), 0)[codes]
+    return pd.Series(months, index=dates.index), pd.Series(years, index=dates.index)
+
+
+def _read_projection(source, read: list[str], **kwargs) -> DataFrame:
+    dtype = {c: 'category' for c in read if c.endswith('_DESC')}
+    return pd.read_csv(source, sep=';', usecols=read, dtype=dtype,
+                       parse_dates=['FX_CARGA'] if 'FX_CARGA' in read else False, **kwargs)
+
+
+def _load_projection_range(path: str, header: list[str], read: list[str], start: int, end: int) -> DataFrame:
+    return _read_projection(io.StringIO(empleo.read_range(path, start, end)), read,
+                            header=None, names=header)
+
+
+def load_columns(archivo: str, columns: Sequence[str], workers: int = 1) -> DataFrame:
+    '''
+    Loads only some columns of an employment csv, as `load_dataframe` would
+    give them but with the descriptions as categories. The other columns are
+    not parsed.
+    Args:
+        archivo (str): path of the csv file
+        columns (Sequence[str]): columns wanted, in order, e.g. REDUCED_COLUMNS
+        workers (int): number of processes used to parse the file
+    Returns:
+        DataFrame: the columns of the file
+    Example:
+        >>> load_columns('inscritos.csv', REDUCED_COLUMNS, workers=4).shape  # doctest: +SKIP
+        (150137, 9)
+    '''
+    unknown = set(columns) - set(empleo.COLUMNS) - set(DERIVED_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown columns {sorted(unknown)}")
+    derived = [c for c in DERIVED_COLUMNS if c in columns]
+    read = [c for c in empleo.COLUMNS
+            if c in columns or (c == 'FECHA_INSCRIPCION' and derived)]
+    header, ranges = empleo.split_ranges(archivo, workers) if workers > 1 else ([], [])
+    if len(ranges) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_load_projection_range, [archivo] * len(ranges), [header] * len(ranges),
+                                  [read] * len(ranges), *zip(*ranges)))
+        data = pd.concat(parts, ignore_index=True)
+        # The parts have their own categories, which concat would turn into strings
+        for c in read:
+            if c.endswith('_DESC'):
+                data[c] = union_categoricals([part[c] for part in parts], sort_categories=True)
+    else:
+        data = _read_projection(archivo, read, encoding='utf-8-sig', engine=ENGINE)
+    if 'DISTRITO_DESC' in read:
+        district = data['DISTRITO_DESC'].cat
+        stripped = district.categories.str.strip()
+        if stripped.is_unique:
+            data['DISTRITO_DESC'] = district.rename_categories(stripped)
+        else:
+            data['DISTRITO_DESC'] = data['DISTRITO_DESC'].astype(str).str.strip().astype('category')
+    if derived:
+        data['MES_INSCRIPCION'], data['ANYO_INSCRIPCION'] = _month_year(data['FECHA_INSCRIPCION'])
+    return data[list(columns)]
+
+
+def _load_range(path: str, header: list[str], start: int, end: int) -> DataFrame:
+    text = empleo.read_range(path, start, end)
+    data = pd.read_csv(io.StringIO(text), sep=';', header=None, names=header,
+                       parse_dates=['FX_CARGA'])
+    return _add_columns(data)
+
+
+def load_dataframe(archivo: str) -> DataFrame:
+    '''
+    Loads an employment csv into a DataFrame. FX_CARGA is parsed as a date,
+    the district descriptions are stripped and the month and the year of
+    FECHA_INSCRIPCION are added as MES_INSCRIPCION and ANYO_INSCRIPCION
+    (year 0 if the date is missing or wrong).
+    Args:
+        archivo (str): path of the csv file
+    Returns:
+        DataFrame: the data of the file
+    Example:
+        >>> load_dataframe('inscritos.csv').shape  # doctest: +SKIP
+        (150137, 15)
+    '''
+    data = pd.read_csv(archivo, sep=';', encoding='utf-8-sig', parse_dates=['FX_CARGA'])
+    return _add_columns(data)
+
+
+def load_dataframe_parallel(archivo: str, workers: int = 4) -> DataFrame:
+    '''
+    Same DataFrame as `load_dataframe`, but the file is split into byte
+    ranges that are parsed in a process pool and joined in the original order
+    Args:
+        archivo (str): path of the csv file
+        workers (int): number of processes used to parse the file
+    Returns:
+        DataFrame: the data of the file
+    Example:
+        >>> load_dataframe_parallel('inscritos.csv', workers=4).shape  # doctest: +SKIP
+        (150137, 15)
+    '''
+    header, ranges = empleo.split_ranges(archivo, workers) if workers > 1 else ([], [])
+    if len(ranges) <= 1:
+        return load_dataframe(archivo)
+    starts, ends = [r[0] for r in ranges], [r[1] for r in ranges]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(_load_range, [archivo] * len(ranges), [header] * len(ranges),
+                              starts, ends))
+    # Columns with missing values in only some of the parts are upcast by concat,
+    # as read_csv does on the whole file
+    return pd.concat(parts, ignore_index=True)
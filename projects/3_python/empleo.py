@@ -0,0 +1,557 @@
+"""
+Columnar loading of the employment (inscritos) CSV files.
+
+Instead of appending every parsed cell to a Python list (see `add_row` and
+`load_employment` in 01_python), the file is read in chunks of rows and each
+column is converted in bulk into a typed numpy array. Every distinct raw
+value is parsed only once, so the cost of `str2int`-like conversions depends
+on the number of distinct values and not on the number of rows.
+
+The result keeps the dict-style access of `EmploymentData`, so functions
+such as `people_by_district`, `mean_age_by_district` or `year_month_data`
+can be used with it unchanged.
+"""
+import csv
+import io
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Iterator, Sequence, TypedDict
+
+import numpy as np
+
+# Columns of the CSV file, in the same order as the header
+COLUMNS = ["FECHA_INSCRIPCION", "GENERO_DESC",
+           "DISTRITO_COD", "DISTRITO_DESC",
+           "EDAD", "NACIONALIDAD_DESC",
+           "OBJETIVOPROFESIONAL1_COD", "OBJETIVOPROFESIONAL1_DESC",
+           "OBJETIVOPROFESIONAL2_COD", "OBJETIVOPROFESIONAL2_DESC",
+           "OBJETIVOPROFESIONAL3_COD", "OBJETIVOPROFESIONAL3_DESC",
+           "FX_CARGA"]
+INT_COLUMNS = {"DISTRITO_COD", "EDAD", "OBJETIVOPROFESIONAL1_COD",
+               "OBJETIVOPROFESIONAL2_COD", "OBJETIVOPROFESIONAL3_COD"}
+MONTH_COLUMNS = {"FECHA_INSCRIPCION"}
+TIMESTAMP_COLUMNS = {"FX_CARGA"}
+# Code and description columns that must agree with each other
+CODE_PAIRS = [("DISTRITO_COD", "DISTRITO_DESC"),
+              ("OBJETIVOPROFESIONAL1_COD", "OBJETIVOPROFESIONAL1_DESC"),
+              ("OBJETIVOPROFESIONAL2_COD", "OBJETIVOPROFESIONAL2_DESC"),
+              ("OBJETIVOPROFESIONAL3_COD", "OBJETIVOPROFESIONAL3_DESC")]
+# Description columns with the same kind of values, which share a vocabulary
+SHARED_VOCABULARIES = [("OBJETIVOPROFESIONAL1_DESC", "OBJETIVOPROFESIONAL2_DESC",
+                        "OBJETIVOPROFESIONAL3_DESC")]
+MONTHS = ['ene', 'feb', 'mar', 'abr', 'may', 'jun',
+          'jul', 'ago', 'sep', 'oct', 'nov', 'dic']
+_MONTH_NUMBERS = {month: number for number, month in enumerate(MONTHS, 1)}
+# Number of CSV rows converted at once
+CHUNK_ROWS = 50_000
+
+
+class Categorical:
+    '''
+    Dictionary-encoded string column: an int32 code per row that points
+    into a small vocabulary of distinct values.
+    Args:
+        codes (np.ndarray): index in `categories` of every row
+        categories (np.ndarray): distinct values, in order of first appearance
+    Examples:
+        >>> col = Categorical(np.array([0, 1, 0]), np.array(['LATINA', 'CENTRO'], dtype=object))
+        >>> list(col)
+        ['LATINA', 'CENTRO', 'LATINA']
+        >>> col[2]
+        'LATINA'
+    '''
+    def __init__(self, codes: np.ndarray, categories: np.ndarray) -> None:
+        self.codes = np.asarray(codes, dtype=np.int32)
+        self.categories = np.asarray(categories, dtype=object)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.categories[self.codes].tolist())
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.categories[self.codes[index]]
+        return Categorical(self.codes[index], self.categories)
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        values = self.categories[self.codes]
+        return values if dtype is None else values.astype(dtype)
+
+    def __repr__(self) -> str:
+        return f"Categorical({len(self)} rows, {len(self.categories)} categories)"
+
+    @classmethod
+    def concat(cls, parts: Sequence['Categorical']) -> 'Categorical':
+        '''
+        Joins several columns, merging their vocabularies
+        Args:
+            parts (Sequence[Categorical]): columns to join, in order
+        Returns:
+            Categorical: a column with the rows of all the parts
+        Examples:
+            >>> a = Categorical(np.array([0, 1]), np.array(['A', 'B'], dtype=object))
+            >>> b = Categorical(np.array([0, 1]), np.array(['C', 'A'], dtype=object))
+            >>> list(Categorical.concat([a, b]))
+            ['A', 'B', 'C', 'A']
+        '''
+        index: dict[str, int] = {}
+        codes = []
+        for part in parts:
+            remap = np.array([index.setdefault(c, len(index)) for c in part.categories],
+                             dtype=np.int32)
+            codes.append(remap[part.codes])
+        return cls(np.concatenate(codes) if codes else np.empty(0, dtype=np.int32),
+                   np.array(list(index), dtype=object))
+
+
+class DateColumn:
+    '''
+    Column of dates stored as a numpy datetime64 array. Single elements and
+    iteration give `datetime` objects, as in `EmploymentData`.
+    Args:
+        values (np.ndarray): datetime64 array with the dates
+    Examples:
+        >>> col = DateColumn(np.array(['2024-01', '1970-01'], dtype='datetime64[M]'))
+        >>> col[0]
+        datetime.datetime(2024, 1, 1, 0, 0)
+        >>> [d.year for d in col]
+        [2024, 1970]
+    '''
+    def __init__(self, values: np.ndarray) -> None:
+        self.values = np.asarray(values)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __iter__(self) -> Iterator[datetime]:
+        return iter(self.values.astype('datetime64[us]').tolist())
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.values[index].astype('datetime64[us]').item()
+        return DateColumn(self.values[index])
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return self.values if dtype is None else self.values.astype(dtype)
+
+    def __repr__(self) -> str:
+        return f"DateColumn({len(self)} rows, {self.values.dtype})"
+
+    @classmethod
+    def concat(cls, parts: Sequence['DateColumn']) -> 'DateColumn':
+        '''
+        Joins several date columns, in order
+        '''
+        return cls(np.concatenate([part.values for part in parts]))
+
+
+class EmploymentColumns(TypedDict):
+    FECHA_INSCRIPCION: DateColumn
+    GENERO_DESC: Categorical
+    DISTRITO_COD: np.ndarray
+    DISTRITO_DESC: Categorical
+    EDAD: np.ndarray
+    NACIONALIDAD_DESC: Categorical
+    OBJETIVOPROFESIONAL1_COD: np.ndarray
+    OBJETIVOPROFESIONAL1_DESC: Categorical
+    OBJETIVOPROFESIONAL2_COD: np.ndarray
+    OBJETIVOPROFESIONAL2_DESC: Categorical
+    OBJETIVOPROFESIONAL3_COD: np.ndarray
+    OBJETIVOPROFESIONAL3_DESC: Categorical
+    FX_CARGA: DateColumn
+
+
+def _factorize(values: Sequence[str]) -> tuple[np.ndarray, list[str]]:
+    '''
+    Encodes every value as the position of its first appearance
+    Args:
+        values (Sequence[str]): values to encode
+    Returns:
+        tuple[np.ndarray, list[str]]: the codes and the distinct values
+    Examples:
+        >>> codes, uniques = _factorize(['b', 'a', 'b'])
+        >>> codes.tolist(), uniques
+        ([0, 1, 0], ['b', 'a'])
+    '''
+    # dict.fromkeys keeps the order of first appearance
+    index = dict.fromkeys(values)
+    for code, value in enumerate(index):
+        index[value] = code
+    codes = np.fromiter(map(index.__getitem__, values), dtype=np.int32, count=len(values))
+    return codes, list(index)
+
+
+def _unique(values) -> tuple[np.ndarray, Sequence[str]]:
+    '''
+    Distinct values of a column and the index of each row among them
+    '''
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'U':
+        uniques, inverse = np.unique(values, return_inverse=True)
+        return inverse.reshape(-1), uniques.tolist()
+    return _factorize(values)
+
+
+_INT32 = np.iinfo(np.int32)
+
+
+def _parse_int(s: str) -> int:
+    try:
+        value = int(s)
+    except (ValueError, TypeError):
+        return 0
+    # Values that do not fit in the int32 columns fall back as wrong ones
+    return value if _INT32.min <= value <= _INT32.max else 0
+
+
+def _parse_month(s: str) -> np.datetime64:
+    try:
+        month, year = s.split('-')
+        # Through datetime, so out-of-range years fall back as in `str2my`
+        return np.datetime64(datetime(int(year) + 2000, _MONTH_NUMBERS[month.lower()], 1), 'M')
+    except (ValueError, TypeError, AttributeError, KeyError):
+        return np.datetime64(0, 'M')
+
+
+def _parse_timestamp(s: str) -> np.datetime64:
+    try:
+        return np.datetime64(datetime.strptime(s, '%Y-%m-%d %H:%M:%S.%f'), 'us')
+    except (ValueError, TypeError):
+        return np.datetime64(0, 'us')
+
+
+def str2int_batch(values: Sequence[str]) -> np.ndarray:
+    '''
+    Converts a whole column of strings into int32, like `str2int` does with
+    one string: wrong or missing values, and values out of the int32 range,
+    become 0. Each distinct string is converted only once.
+    Args:
+        values (Sequence[str]): list or array of strings
+    Returns:
+        np.ndarray: int32 array with the converted values
+    Examples:
+        >>> str2int_batch(['123', '0', 'abc', '123', '99999999999'])
+        array([123,   0,   0, 123,   0], dtype=int32)
+    '''
+    codes, uniques = _unique(values)
+    return np.array([_parse_int(u) for u in uniques], dtype=np.int32)[codes]
+
+
+def str2dt_batch(values: Sequence[str]) -> np.ndarray:
+    '''
+    Converts a whole column of load timestamps such as '2025-08-07 00:11:57.897'
+    into datetime64[us], like `str2dt` does with one string: wrong or missing
+    values become 1970-01-01. Each distinct string is parsed only once.
+    Args:
+        values (Sequence[str]): list or array of strings
+    Returns:
+        np.ndarray: datetime64[us] array with the converted values
+    Examples:
+        >>> str2dt_batch(['2025-08-07 00:11:57.897', '', '2025-08-07 00:11:57.897'])
+        array(['2025-08-07T00:11:57.897000', '1970-01-01T00:00:00.000000',
+               '2025-08-07T00:11:57.897000'], dtype='datetime64[us]')
+    '''
+    codes, uniques = _unique(values)
+    return np.array([_parse_timestamp(u) for u in uniques], dtype='datetime64[us]')[codes]
+
+
+def str2my_batch(values: Sequence[str]) -> np.ndarray:
+    '''
+    Converts a whole column of month-year strings such as 'ene-24' into
+    datetime64[M], like `str2my` does with one string: wrong or missing
+    values become 1970-01. Each distinct string is parsed only once.
+    Args:
+        values (Sequence[str]): list or array of strings
+    Returns:
+        np.ndarray: datetime64[M] array with the converted values
+    Examples:
+        >>> str2my_batch(['ene-24', 'dic-14', '', 'ene-24'])
+        array(['2024-01', '2014-12', '1970-01', '2024-01'], dtype='datetime64[M]')
+    '''
+    codes, uniques = _unique(values)
+    return np.array([_parse_month(u) for u in uniques], dtype='datetime64[M]')[codes]
+
+
+def _convert(column: str, raw: Sequence[str]):
+    '''
+    Converts the raw strings of a column into its typed representation,
+    stripping and parsing each distinct value only once
+    '''
+    codes, uniques = _factorize(raw)
+    stripped = [u.strip() for u in uniques]
+    if column in INT_COLUMNS:
+        return str2int_batch(stripped)[codes]
+    if column in MONTH_COLUMNS:
+        return DateColumn(str2my_batch(stripped)[codes])
+    if column in TIMESTAMP_COLUMNS:
+        return DateColumn(str2dt_batch(stripped)[codes])
+    # Distinct values that only differ in surrounding spaces share a category
+    merged, categories = _factorize(stripped)
+    return Categorical(merged[codes], np.array([sys.intern(c) for c in categories], dtype=object))
+
+
+def share_vocabulary(columns: Sequence[Categorical]) -> list[Categorical]:
+    '''
+    Re-encodes several columns with a single vocabulary, so each distinct
+    value is stored once for all of them and their codes can be compared
+    Args:
+        columns (Sequence[Categorical]): columns with values of the same kind
+    Returns:
+        list[Categorical]: the same columns, sharing their categories
+    Examples:
+        >>> a = Categorical(np.array([0, 1]), np.array(['A', 'B'], dtype=object))
+        >>> b = Categorical(np.array([0, 0]), np.array(['B'], dtype=object))
+        >>> a2, b2 = share_vocabulary([a, b])
+        >>> b2.codes.tolist(), a2.categories is b2.categories
+        ([1, 1], True)
+    '''
+    index: dict[str, int] = {}
+    remaps = [np.array([index.setdefault(c, len(index)) for c in col.categories], dtype=np.int32)
+              for col in columns]
+    categories = np.array(list(index), dtype=object)
+    return [Categorical(remap[col.codes], categories) for col, remap in zip(columns, remaps)]
+
+
+def _share_vocabularies(data: EmploymentColumns) -> EmploymentColumns:
+    for group in SHARED_VOCABULARIES:
+        group = [col for col in group if col in data]
+        for col, shared in zip(group, share_vocabulary([data[col] for col in group])):
+            data[col] = shared
+    return data
+
+
+def parse_rows(header: Sequence[str], rows: Sequence[Sequence[str]]) -> EmploymentColumns:
+    '''
+    Converts rows as returned by `csv.reader` into typed columns. Missing or
+    wrong values become 0 or 1970-01-01, as in `add_row`.
+    Args:
+        header (Sequence[str]): names of the fields of each row
+        rows (Sequence[Sequence[str]]): rows of raw strings
+    Returns:
+        EmploymentColumns: the converted columns
+    Examples:
+        >>> data = parse_rows(['EDAD', 'DISTRITO_DESC'], [['34', ' LATINA'], ['', ' LATINA']])
+        >>> data['EDAD'].tolist(), list(data['DISTRITO_DESC'])
+        ([34, 0], ['LATINA', 'LATINA'])
+        >>> data['FECHA_INSCRIPCION'][0]
+        datetime.datetime(1970, 1, 1, 0, 0)
+    '''
+    width = len(header)
+    rows = [r if len(r) == width else (list(r) + [''] * width)[:width] for r in rows]
+    fields = dict(zip(header, zip(*rows))) if rows else {}
+    missing = ('',) * len(rows)
+    return _share_vocabularies({col: _convert(col, fields.get(col, missing)) for col in COLUMNS})
+
+
+def concat_columns(parts: Sequence[EmploymentColumns]) -> EmploymentColumns:
+    '''
+    Joins several groups of columns, keeping the order of the rows
+    Args:
+        parts (Sequence[EmploymentColumns]): groups of columns to join, all
+            with the same columns (all of them or only some)
+    Returns:
+        EmploymentColumns: columns with the rows of all the parts
+    '''
+    if not parts:
+        return parse_rows(COLUMNS, [])
+    data = {}
+    for col in [c for c in COLUMNS if c in parts[0]]:
+        first = parts[0][col]
+        if isinstance(first, (Categorical, DateColumn)):
+            data[col] = type(first).concat([part[col] for part in parts])
+        else:
+            data[col] = np.concatenate([part[col] for part in parts])
+    return _share_vocabularies(data)
+
+
+def _reader_chunks(reader, header: Sequence[str], chunk_rows: int) -> Iterator[EmploymentColumns]:
+    while True:
+        chunk = list(islice(reader, chunk_rows))
+        if not chunk:
+            break
+        # Blank lines are skipped, like csv.DictReader does
+        rows = [row for row in chunk if row]
+        if rows:
+            yield parse_rows(header, rows)
+
+
+def iter_chunks(path: str, chunk_rows: int = CHUNK_ROWS) -> Iterator[EmploymentColumns]:
+    '''
+    Reads an employment csv by chunks of rows, converting each one into columns
+    Args:
+        path (str): path of the csv file
+        chunk_rows (int): maximum number of rows of each chunk
+    Returns:
+        Iterator[EmploymentColumns]: the columns of each chunk, in file order
+    '''
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f, delimiter=';')
+        header = next(reader, [])
+        yield from _reader_chunks(reader, header, chunk_rows)
+
+
+def split_ranges(path: str, parts: int) -> tuple[list[str], list[tuple[int, int]]]:
+    '''
+    Splits the data lines of a csv file into byte ranges of similar size that
+    start and end on line boundaries. The header line (and its BOM, if any)
+    is not part of any range. Fields must not contain line breaks.
+    Args:
+        path (str): path of the csv file
+        parts (int): number of ranges wanted
+    Returns:
+        tuple[list[str], list[tuple[int, int]]]: the fields of the header and
+            the (start, end) byte offsets of each non empty range
+    '''
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = next(csv.reader([f.readline().decode('utf-8-sig')], delimiter=';'), [])
+        bounds = [f.tell()]
+        for i in range(1, parts):
+            pos = bounds[0] + (size - bounds[0]) * i // parts
+            if pos <= bounds[-1]:
+                continue
+            # Move the boundary to the start of the next line
+            f.seek(pos - 1)
+            f.readline()
+            bounds.append(f.tell())
+        bounds.append(size)
+    return header, [(a, b) for a, b in zip(bounds, bounds[1:]) if a < b]
+
+
+def read_range(path: str, start: int, end: int) -> str:
+    '''
+    Text of the byte range [start, end) of a utf-8 file
+    '''
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return f.read(end - start).decode('utf-8')
+
+
+def load_range(path: str, header: Sequence[str], start: int, end: int) -> EmploymentColumns:
+    '''
+    Loads into columns the csv lines of a byte range given by `split_ranges`
+    Args:
+        path (str): path of the csv file
+        header (Sequence[str]): fields of the header of the file
+        start (int): offset of the first byte of the range
+        end (int): offset past the last byte of the range
+    Returns:
+        EmploymentColumns: the columns of the lines of the range
+    '''
+    reader = csv.reader(io.StringIO(read_range(path, start, end), newline=''), delimiter=';')
+    return concat_columns(list(_reader_chunks(reader, header, CHUNK_ROWS)))
+
+
+def load_employment_columnar(path: str, workers: int = 1) -> EmploymentColumns:
+    '''
+    Loads an employment csv into typed columns: int32 codes and ages,
+    datetime64 dates and dictionary-encoded descriptions. With several
+    workers the file is split into byte ranges that are parsed in a process
+    pool; the result is the same as with a single worker.
+    Args:
+        path (str): path of the csv file
+        workers (int): number of processes used to parse the file
+    Returns:
+        EmploymentColumns: a dictionary of columns populated from the csv
+    Example:
+        >>> data = load_employment_columnar("inscritos.csv", workers=4)  # doctest: +SKIP
+        >>> data['EDAD'].dtype                                           # doctest: +SKIP
+        dtype('int32')
+    '''
+    if workers <= 1:
+        return concat_columns(list(iter_chunks(path)))
+    header, ranges = split_ranges(path, workers)
+    starts, ends = [r[0] for r in ranges], [r[1] for r in ranges]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # map keeps the order of the ranges, and so the order of the rows
+        parts = list(pool.map(load_range, [path] * len(ranges), [header] * len(ranges), starts, ends))
+    return concat_columns(parts)
+
+
+def code_conflicts(data: EmploymentColumns) -> dict[str, dict[int, list[str]]]:
+    '''
+    Codes that appear with more than one description in the pairs of
+    CODE_PAIRS. Code 0 (missing) is not checked.
+    Args:
+        data (EmploymentColumns): the columns to check
+    Returns:
+        dict[str, dict[int, list[str]]]: for each code column with conflicts,
+            the descriptions found for each conflicting code
+    Examples:
+        >>> data = parse_rows(['DISTRITO_COD', 'DISTRITO_DESC'],
+        ...                   [['10', ' LATINA'], ['10', 'LATINA'], ['1', ' CENTRO'], ['1', ' SOL']])
+        >>> code_conflicts(data)
+        {'DISTRITO_COD': {1: ['CENTRO', 'SOL']}}
+    '''
+    conflicts = {}
+    for cod, desc in CODE_PAIRS:
+        codes, labels = np.asarray(data[cod]), data[desc]
+        known = codes != 0
+        # Distinct (code, description) pairs, found with a single sort
+        pairs = np.unique(np.stack([codes[known].astype(np.int64), labels.codes[known]]), axis=1)
+        values, counts = np.unique(pairs[0], return_counts=True)
+        bad = values[counts > 1]
+        if len(bad):
+            conflicts[cod] = {int(code): sorted(labels.categories[pairs[1][pairs[0] == code]].tolist())
+                              for code in bad}
+    return conflicts
+
+
+def registration_years(ed: EmploymentColumns) -> np.ndarray:
+    '''
+    Registration year (FECHA_INSCRIPCION) of every record; 1970 if the date is missing
+    Args:
+        ed (EmploymentColumns): the employment columns
+    Returns:
+        np.ndarray: int64 array with the years
+    Examples:
+        >>> registration_years(parse_rows(['FECHA_INSCRIPCION'], [['ene-24'], ['dic-17'], ['']]))
+        array([2024, 2017, 1970])
+    '''
+    months = np.asarray(ed['FECHA_INSCRIPCION']).astype('datetime64[M]').astype(np.int64)
+    return months // 12 + 1970
+
+
+def people_by_district(ed: EmploymentColumns) -> list[tuple[str, int]]:
+    '''
+    Count how many records fall into each district, counting the district
+    codes with np.bincount and decoding only the final labels
+    Args:
+        ed (EmploymentColumns): the employment columns
+    Returns:
+        list[tuple[str, int]]: districts and their number of records, sorted by number of records
+    Examples:
+        >>> people_by_district(parse_rows(['DISTRITO_DESC'], [[' LATINA'], [' CENTRO'], [' LATINA']]))
+        [('LATINA', 2), ('CENTRO', 1)]
+    '''
+    districts = ed['DISTRITO_DESC']
+    counts = np.bincount(districts.codes, minlength=len(districts.categories))
+    # Stable sort: districts with the same count keep their order of appearance
+    order = np.argsort(-counts, kind='stable')
+    return [(districts.categories[i], int(counts[i])) for i in order if counts[i]]
+
+
+def mean_age_by_district(ed: EmploymentColumns) -> dict[str, float]:
+    '''
+    Calculates the mean age for each district, skipping missing ages (0),
+    with np.bincount over the district codes
+    Args:
+        ed (EmploymentColumns): the employment columns
+    Returns:
+        dict[str, float]: dictionary with district names as keys and mean ages as values
+    Examples:
+        >>> ed = parse_rows(['DISTRITO_DESC', 'EDAD'], [['CENTRO', '25'], ['LATINA', '30'],
+        ...                                             ['CENTRO', '35'], ['LATINA', '']])
+        >>> mean_age_by_district(ed)
+        {'CENTRO': 30.0, 'LATINA': 30.0}
+    '''
+    districts, ages = ed['DISTRITO_DESC'], np.asarray(ed['EDAD'])
+    known = ages != 0
+    n = len(districts.categories)
+    sums = np.bincount(districts.codes[known], weights=ages[known], minlength=n)
+    counts = np.bincount(districts.codes[known], minlength=n)
+    return {districts.categories[i]: float(sums[i] / counts[i]) for i in np.flatnonzero(counts)}
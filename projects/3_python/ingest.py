@@ -0,0 +1,285 @@
+"""
+Incremental ingestion of employment CSV files.
+
+`ingest` keeps, next to the csv file, the columns parsed so far and the
+statistics of `aggregate.EmploymentAggregator` (district counts, age sums
+and the year x month matrix), together with a watermark: the byte offset up
+to which the file was read and the latest FX_CARGA ingested. Each call only
+parses what was added since the previous one:
+
+- If the size and modification time of the file did not change, nothing
+  is read.
+- If the file grew and the bytes before the offset did not change (same
+  hash of the first and of the last block before the offset), only the
+  lines after the offset are read (append-only files). Checking two blocks
+  keeps a refresh independent of the size of the history; an edit in the
+  middle of the ingested part that keeps both blocks is not detected.
+- If the file was rewritten (e.g. a new full export), it is read again but
+  only the records loaded at or after the watermark (FX_CARGA) are added.
+  The records loaded at the watermark are told apart from the ones already
+  ingested by a hash of all their fields.
+
+New records are stored as a new segment of .npy files and added to the
+statistics, so a refresh costs time proportional to the new records.
+A trailing line without its line break is left for the next call.
+The rename of state.json is the only commit point: segments and watermark
+files that it does not list (left by an interrupted call) are removed.
+"""
+import csv
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import uuid
+
+import numpy as np
+
+import empleo
+from aggregate import EmploymentAggregator
+from cache import read_columns, write_columns
+from empleo import Categorical, EmploymentColumns
+
+INGEST_VERSION = 3
+_BLOCK_BYTES = 1 << 20
+
+
+def ingest_dir_for(path: str) -> str:
+    '''
+    Default directory of the ingested data of a csv file
+    Examples:
+        >>> ingest_dir_for('data/inscritos.csv')
+        'data/inscritos.csv.ingest'
+    '''
+    return path + '.ingest'
+
+
+def _read_state(store_dir: str) -> dict | None:
+    try:
+        with open(os.path.join(store_dir, "state.json"), encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state if state.get("version") == INGEST_VERSION else None
+
+
+def _write_state(store_dir: str, state: dict) -> None:
+    # Written to a temporary file and renamed, so a failed ingest leaves the old state
+    tmp = os.path.join(store_dir, "state.json.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp, os.path.join(store_dir, "state.json"))
+
+
+def _hash_range(f, hasher, start: int, end: int):
+    '''
+    Adds the bytes in [start, end) of a file to a hash and returns it
+    '''
+    f.seek(start)
+    while start < end:
+        block = f.read(min(_BLOCK_BYTES, end - start))
+        if not block:
+            break
+        hasher.update(block)
+        start += len(block)
+    return hasher
+
+
+def _value_hashes(values) -> np.ndarray:
+    if isinstance(values, Categorical):
+        labels, codes = values.categories, values.codes
+    else:
+        values = np.asarray(values)
+        if values.dtype.kind in 'iuM':
+            return values.view(np.int64).astype(np.uint64) if values.dtype.kind == 'M' \
+                else values.astype(np.int64).astype(np.uint64)
+        labels, codes = np.unique(values.astype(str), return_inverse=True)
+    hashes = [int.from_bytes(hashlib.blake2b(str(v).encode(), digest_size=8).digest(), 'little')
+              for v in labels]
+    return np.array(hashes, dtype=np.uint64)[np.asarray(codes).reshape(-1)]
+
+
+def row_keys(data: EmploymentColumns) -> np.ndarray:
+    '''
+    64-bit hash of all the fields of every record, equal for equal records
+    Examples:
+        >>> data = empleo.parse_rows(['DISTRITO_DESC', 'EDAD'], [['CENTRO', '30'], ['LATINA', '30'],
+        ...                                                      ['CENTRO', '30']])
+        >>> keys = row_keys(data).tolist()
+        >>> keys[0] == keys[2], keys[0] == keys[1]
+        (True, False)
+    '''
+    keys = np.zeros(len(next(iter(data.values()), [])), dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for column in sorted(data):
+            keys = (keys ^ _value_hashes(data[column])) * np.uint64(0x100000001B3)
+    return keys
+
+
+def _not_stored(keys: np.ndarray, stored: np.ndarray) -> np.ndarray:
+    '''
+    Mask of the keys that are not in `stored` (sorted), as many times as
+    they are repeated: a key stored twice masks its first two occurrences
+    '''
+    order = np.argsort(keys, kind='stable')
+    ordered = keys[order]
+    rank = np.arange(len(ordered)) - np.searchsorted(ordered, ordered, 'left')
+    count = np.searchsorted(stored, ordered, 'right') - np.searchsorted(stored, ordered, 'left')
+    mask = np.empty(len(keys), dtype=bool)
+    mask[order] = rank >= count
+    return mask
+
+
+def _edges(f, end: int) -> list[str]:
+    '''
+    Hashes of the first and of the last block of [0, end) of a file
+    '''
+    return [_hash_range(f, hashlib.blake2b(digest_size=20), start, stop).hexdigest()
+            for start, stop in [(0, min(end, _BLOCK_BYTES)), (max(0, end - _BLOCK_BYTES), end)]]
+
+
+def _complete_end(f, start: int, size: int) -> int:
+    '''
+    Offset past the last line break in [start, size), reading blocks
+    backwards from the end
+    '''
+    end = size
+    while end > start:
+        block_start = max(start, end - _BLOCK_BYTES)
+        f.seek(block_start)
+        pos = f.read(end - block_start).rfind(b'\n')
+        if pos >= 0:
+            return block_start + pos + 1
+        end = block_start
+    return start
+
+
+def _remove_unlisted(store_dir: str, state: dict | None) -> None:
+    # Segments and watermark files of a call interrupted before its state was written
+    listed = set(state["segments"]) | {state["watermark_keys"]} if state else set()
+    for name in os.listdir(store_dir):
+        if name.startswith(('segment_', 'watermark_', '.tmp-')) and name not in listed:
+            path = os.path.join(store_dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+
+def _new_state(header: list[str], data_start: int) -> dict:
+    return {"version": INGEST_VERSION, "header": header, "data_start": data_start,
+            "offset": data_start, "edges": [], "size": None, "mtime_ns": None,
+            "fx_carga_max": None, "watermark_keys": None, "rows": 0, "segments": [],
+            "aggregates": EmploymentAggregator().to_dict()}
+
+
+def ingest(path: str, store_dir: str | None = None) -> dict:
+    '''
+    Adds the records of a csv file that were not ingested yet
+    Args:
+        path (str): path of the csv file
+        store_dir (str): directory of the ingested data, by default the one of `ingest_dir_for`
+    Returns:
+        dict: "new_rows" added, "rows" in total, whether the file was read
+            from the start ("rescanned") and the current "fx_carga_max"
+    Example:
+        >>> ingest('inscritos.csv')  # doctest: +SKIP
+        {'new_rows': 150137, 'rows': 150137, 'rescanned': True, 'fx_carga_max': '2025-08-07T00:11:57.897000'}
+    '''
+    store_dir = store_dir or ingest_dir_for(path)
+    os.makedirs(store_dir, exist_ok=True)
+    stat = os.stat(path)
+    size = stat.st_size
+    state = _read_state(store_dir)
+    if state is not None and (state["size"], state["mtime_ns"]) == (size, stat.st_mtime_ns):
+        return {"new_rows": 0, "rows": state["rows"], "rescanned": False,
+                "fx_carga_max": state["fx_carga_max"]}
+    _remove_unlisted(store_dir, state)
+    with open(path, 'rb') as f:
+        header = next(csv.reader([f.readline().decode('utf-8-sig')], delimiter=';'), [])
+        data_start = f.tell()
+        if state is None:
+            state = _new_state(header, data_start)
+        appended = (state["header"] == header and state["data_start"] == data_start
+                    and size >= state["offset"] and _edges(f, state["offset"]) == state["edges"])
+        start = state["offset"] if appended else data_start
+        end = _complete_end(f, start, size)
+        edges = _edges(f, end)
+    data = empleo.load_range(path, header, start, end) if end > start else None
+    stored = np.load(os.path.join(store_dir, state["watermark_keys"])) if state["watermark_keys"] else None
+    if data is not None and not appended and state["fx_carga_max"] is not None:
+        # A rewritten file: only the records loaded from the watermark on can be
+        # new, and the ones loaded at the watermark may be stored already
+        fx_carga, watermark = np.asarray(data['FX_CARGA']), np.datetime64(state["fx_carga_max"])
+        newer = fx_carga > watermark
+        at_watermark = np.flatnonzero(fx_carga == watermark)
+        keys = row_keys({col: values[at_watermark] for col, values in data.items()})
+        newer[at_watermark] = _not_stored(keys, stored if stored is not None else np.zeros(0, np.uint64))
+        data = {col: values[newer] for col, values in data.items()}
+    new_rows = len(data['FX_CARGA']) if data is not None else 0
+    old_keys = state["watermark_keys"]
+    if new_rows:
+        # A unique name, so that an interrupted call cannot block the next ones
+        segment = f"segment_{len(state['segments']):05d}_{uuid.uuid4().hex[:8]}"
+        tmp = tempfile.mkdtemp(prefix='.tmp-', dir=store_dir)
+        try:
+            meta = write_columns(data, tmp)
+            with open(os.path.join(tmp, "meta.json"), 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(tmp, os.path.join(store_dir, segment))
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        agg = EmploymentAggregator.from_dict(state["aggregates"])
+        agg.update(data)
+        fx_carga = np.asarray(data['FX_CARGA'])
+        latest = fx_carga.max()
+        if state["fx_carga_max"] is not None and latest < np.datetime64(state["fx_carga_max"]):
+            latest = np.datetime64(state["fx_carga_max"])
+        # Keys of all the stored records loaded at the watermark
+        at_latest = np.flatnonzero(fx_carga == latest)
+        keys = row_keys({col: values[at_latest] for col, values in data.items()})
+        if stored is not None and str(latest) == state["fx_carga_max"]:
+            keys = np.concatenate([stored, keys])
+        state["watermark_keys"] = f"watermark_{segment}.npy"
+        np.save(os.path.join(store_dir, state["watermark_keys"]), np.sort(keys))
+        state["fx_carga_max"] = str(latest)
+        state["segments"].append(segment)
+        state["rows"] += new_rows
+        state["aggregates"] = agg.to_dict()
+    state.update(header=header, data_start=data_start, offset=end, edges=edges,
+                 size=size, mtime_ns=stat.st_mtime_ns)
+    _write_state(store_dir, state)
+    if old_keys and old_keys != state["watermark_keys"]:
+        os.remove(os.path.join(store_dir, old_keys))
+    return {"new_rows": new_rows, "rows": state["rows"], "rescanned": not appended,
+            "fx_carga_max": state["fx_carga_max"]}
+
+
+def load_ingested(path: str, store_dir: str | None = None) -> EmploymentColumns:
+    '''
+    Columns of all the records ingested from a csv file
+    Args:
+        path (str): path of the csv file
+        store_dir (str): directory of the ingested data, by default the one of `ingest_dir_for`
+    Returns:
+        EmploymentColumns: the records, in the order they were ingested
+    '''
+    store_dir = store_dir or ingest_dir_for(path)
+    state = _read_state(store_dir)
+    parts = []
+    for segment in (state["segments"] if state else []):
+        with open(os.path.join(store_dir, segment, "meta.json"), encoding='utf-8') as f:
+            parts.append(read_columns(os.path.join(store_dir, segment), json.load(f)))
+    return empleo.concat_columns(parts)
+
+
+def ingested_aggregates(path: str, store_dir: str | None = None) -> EmploymentAggregator:
+    '''
+    District and month statistics of all the records ingested from a csv file
+    Example:
+        >>> ingested_aggregates('inscritos.csv').people_by_district()[0]  # doctest: +SKIP
+        ('OTRO MUNICIPIO', 18297)
+    '''
+    state = _read_state(store_dir or ingest_dir_for(path))
+    return EmploymentAggregator.from_dict(state["aggregates"]) if state else EmploymentAggregator()
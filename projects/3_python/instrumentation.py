@@ -0,0 +1,254 @@
+"""
+Opt-in instrumentation of the parsing and aggregation functions.
+
+`instrumented(namespace, names)` replaces some functions of a module or of
+the globals of a notebook by timed wrappers, and puts the originals back on
+exit. Nothing is patched outside of it, so the functions cost nothing extra
+when the instrumentation is off. Inside, `Metrics` records:
+
+- calls, cumulative time, mean and p99 latency and exceptions of every function;
+- rows and rows/s of the functions that return the records (e.g.
+  `load_employment`, `load_dataframe`);
+- per parsed column, the values that fell back to 0 or 1970-01-01: missing
+  values (empty fields) and parse errors (fields that could not be parsed).
+  Errors are told apart from missing values by the `add_row` wrapper, which
+  sees the raw fields; loaders only report the fallbacks of their result.
+  When instrumented functions call each other (a loader and `parse_rows`),
+  the fallbacks are counted only by the innermost one.
+
+The metrics can be written as json or in the Prometheus text format.
+"""
+import contextlib
+import functools
+import json
+import random
+import time
+from datetime import datetime
+from typing import Callable, Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+
+import empleo
+
+# Latencies kept per function to estimate the p99 (a uniform sample beyond that)
+MAX_SAMPLES = 100_000
+_EPOCH = datetime(1970, 1, 1)
+_ZERO_LITERALS = {'0', '1970-01-01', '1970-01-01 00:00:00'}
+
+
+class Metrics:
+    '''
+    Counters of the instrumented functions and of the parsed columns
+    '''
+    def __init__(self, max_samples: int = MAX_SAMPLES, seed: int | None = None) -> None:
+        self.max_samples = max_samples
+        self.functions: dict[str, dict] = {}
+        self.columns: dict[str, dict[str, int]] = {}
+        # Number of times some fallbacks were counted, so that an outer call
+        # does not count again the ones of the calls it made
+        self.fallback_records = 0
+        self._rng = random.Random(seed)
+
+    def _function(self, name: str) -> dict:
+        if name not in self.functions:
+            self.functions[name] = {"calls": 0, "seconds": 0.0, "errors": 0, "rows": 0, "samples": []}
+        return self.functions[name]
+
+    def _column(self, column: str) -> dict[str, int]:
+        return self.columns.setdefault(column, {"fallbacks": 0, "missing": 0, "parse_errors": 0})
+
+    def record_call(self, name: str, seconds: float, error: bool = False) -> None:
+        stats = self._function(name)
+        stats["calls"] += 1
+        stats["seconds"] += seconds
+        stats["errors"] += error
+        samples = stats["samples"]
+        if len(samples) < self.max_samples:
+            samples.append(seconds)
+        else:
+            # Reservoir sampling keeps a uniform sample of all the calls
+            pos = self._rng.randrange(stats["calls"])
+            if pos < self.max_samples:
+                samples[pos] = seconds
+
+    def record_rows(self, name: str, data, fallbacks: bool = True) -> None:
+        '''
+        Rows of the result of a loader and, if `fallbacks`, the fallbacks of
+        its parsed columns
+        '''
+        if isinstance(data, pd.DataFrame):
+            self._function(name)["rows"] += len(data)
+            if fallbacks:
+                self.fallback_records += 1
+                for column in empleo.INT_COLUMNS | empleo.TIMESTAMP_COLUMNS:
+                    if column in data:
+                        self._column(column)["fallbacks"] += int(data[column].isna().sum())
+            return
+        if not isinstance(data, dict) or not data:
+            return
+        self._function(name)["rows"] += len(next(iter(data.values())))
+        if not fallbacks:
+            return
+        self.fallback_records += 1
+        for column, values in data.items():
+            if column in empleo.INT_COLUMNS:
+                self._column(column)["fallbacks"] += int(np.count_nonzero(np.asarray(values) == 0))
+            elif column in empleo.MONTH_COLUMNS | empleo.TIMESTAMP_COLUMNS:
+                values = np.asarray(values)
+                epoch = np.datetime64(0, 's') if values.dtype.kind == 'M' else _EPOCH
+                self._column(column)["fallbacks"] += int(np.count_nonzero(values == epoch))
+
+    def record_row(self, data, row: dict) -> None:
+        '''
+        Fallbacks of the last row added to the records, from its raw fields
+        '''
+        self.fallback_records += 1
+        for column in empleo.INT_COLUMNS | empleo.MONTH_COLUMNS | empleo.TIMESTAMP_COLUMNS:
+            if column not in data or not data[column]:
+                continue
+            value = data[column][-1]
+            if value != 0 and value != _EPOCH:
+                continue
+            raw = (row.get(column) or '').strip()
+            stats = self._column(column)
+            stats["fallbacks"] += 1
+            if not raw:
+                stats["missing"] += 1
+            elif raw not in _ZERO_LITERALS:
+                stats["parse_errors"] += 1
+
+    def summary(self) -> dict:
+        '''
+        The metrics as a dictionary, with the p99 and mean latency and rows/s
+        of every function
+        Examples:
+            >>> metrics = Metrics()
+            >>> for s in [0.001] * 99 + [0.1]:
+            ...     metrics.record_call('str2int', s)
+            >>> stats = metrics.summary()['functions']['str2int']
+            >>> stats['calls'], round(stats['p99_s'], 4)
+            (100, 0.001)
+        '''
+        functions = {}
+        for name, stats in self.functions.items():
+            samples = np.asarray(stats["samples"])
+            functions[name] = {
+                "calls": stats["calls"], "seconds": stats["seconds"], "errors": stats["errors"],
+                "mean_s": stats["seconds"] / stats["calls"] if stats["calls"] else 0.0,
+                "p99_s": float(np.percentile(samples, 99, method='inverted_cdf')) if len(samples) else 0.0,
+                "rows": stats["rows"],
+                "rows_per_s": stats["rows"] / stats["seconds"] if stats["rows"] and stats["seconds"] else 0.0}
+        return {"functions": functions, "columns": {c: dict(v) for c, v in self.columns.items()}}
+
+    def to_json(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def to_prometheus(self, path: str | None = None, prefix: str = 'empleo') -> str:
+        '''
+        The metrics in the Prometheus text format, written to `path` if given
+        Examples:
+            >>> metrics = Metrics()
+            >>> metrics.record_call('str2int', 0.5)
+            >>> print(metrics.to_prometheus().splitlines()[1])
+            empleo_calls_total{function="str2int"} 1
+        '''
+        summary = self.summary()
+        series = [("calls_total", "counter", "function", "calls"),
+                  ("seconds_total", "counter", "function", "seconds"),
+                  ("errors_total", "counter", "function", "errors"),
+                  ("latency_p99_seconds", "gauge", "function", "p99_s"),
+                  ("rows_total", "counter", "function", "rows"),
+                  ("rows_per_second", "gauge", "function", "rows_per_s"),
+                  ("fallbacks_total", "counter", "column", "fallbacks"),
+                  ("missing_total", "counter", "column", "missing"),
+                  ("parse_errors_total", "counter", "column", "parse_errors")]
+        lines = []
+        for metric, kind, label, key in series:
+            values = summary["functions" if label == "function" else "columns"]
+            lines.append(f"# TYPE {prefix}_{metric} {kind}")
+            lines += [f'{prefix}_{metric}{{{label}="{_escape(name)}"}} {stats[key]}'
+                      for name, stats in values.items()]
+        text = '\n'.join(lines) + '\n'
+        if path is not None:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        return text
+
+
+def _escape(value: str) -> str:
+    '''
+    Label value escaped as the Prometheus text format requires
+    Examples:
+        >>> print(_escape('CENTRO "1"'))
+        CENTRO \\"1\\"
+        >>> print(_escape('a\\nb\\\\c'))
+        a\\nb\\\\c
+    '''
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def wrap(fun: Callable, metrics: Metrics, name: str | None = None) -> Callable:
+    '''
+    Timed version of a function that records its calls in `metrics`
+    Examples:
+        >>> namespace = {'parse_rows': empleo.parse_rows}
+        >>> def load_ages(rows):
+        ...     return namespace['parse_rows'](['EDAD'], rows)
+        >>> namespace['load_ages'] = load_ages
+        >>> with instrumented(namespace, ['parse_rows', 'load_ages']) as metrics:
+        ...     _ = namespace['load_ages']([['30'], ['']])
+        >>> metrics.summary()['columns']['EDAD']['fallbacks']
+        1
+    '''
+    name = name or fun.__name__
+    counts_rows = name.startswith('load_') or name == 'parse_rows'
+
+    @functools.wraps(fun)
+    def wrapper(*args, **kwargs):
+        recorded = metrics.fallback_records
+        start = time.perf_counter()
+        try:
+            result = fun(*args, **kwargs)
+        except BaseException:
+            metrics.record_call(name, time.perf_counter() - start, error=True)
+            raise
+        metrics.record_call(name, time.perf_counter() - start)
+        if name == 'add_row' and len(args) >= 2:
+            metrics.record_row(args[0], args[1])
+        elif counts_rows:
+            # The fallbacks were counted already if an inner call counted them
+            metrics.record_rows(name, result, fallbacks=metrics.fallback_records == recorded)
+        return result
+    return wrapper
+
+
+@contextlib.contextmanager
+def instrumented(namespace, names: Iterable[str], metrics: Metrics | None = None) -> Iterator[Metrics]:
+    '''
+    Instruments some functions of a module or of a dictionary of globals
+    while the block runs
+    Args:
+        namespace: module or dictionary (e.g. globals() of a notebook) with the functions
+        names (Iterable[str]): names of the functions to instrument
+        metrics (Metrics): where to record the metrics; a new one if None
+    Returns:
+        Iterator[Metrics]: the metrics
+    Example:
+        >>> with instrumented(globals(), ['load_employment', 'add_row', 'str2int',
+        ...                               'str2dt', 'str2my']) as metrics:  # doctest: +SKIP
+        ...     data = load_employment('inscritos.csv')
+        >>> metrics.to_prometheus('metrics.prom')  # doctest: +SKIP
+    '''
+    metrics = metrics if metrics is not None else Metrics()
+    get = namespace.__getitem__ if isinstance(namespace, dict) else functools.partial(getattr, namespace)
+    put = namespace.__setitem__ if isinstance(namespace, dict) else functools.partial(setattr, namespace)
+    originals = {name: get(name) for name in names}
+    try:
+        for name, fun in originals.items():
+            put(name, wrap(fun, metrics, name))
+        yield metrics
+    finally:
+        for name, fun in originals.items():
+            put(name, fun)
@@ -0,0 +1,242 @@
+"""
+Inverted index of the professional objectives of the employment records.
+
+Each record lists up to three occupation codes (OBJETIVOPROFESIONAL1_COD to
+OBJETIVOPROFESIONAL3_COD, 0 if missing). `OccupationIndex` maps every code
+to the sorted ids (positions) of the records that list it in any of the
+three slots, stored as a single CSR-like pair of arrays, and keeps a
+bitmap (np.packbits) of the records of every district and every year. A
+query such as "records of CENTRO in 2024 that want 5833" is then a lookup
+and a few bit tests, instead of a scan of the three columns.
+
+The index is saved as .npy files next to the csv file and, as `cache`
+does, rebuilt when the file changes.
+"""
+import json
+import os
+import shutil
+import tempfile
+from typing import Iterable
+
+import numpy as np
+
+import empleo
+from cache import file_hash, load_array, read_meta, source_info
+from empleo import Categorical, EmploymentColumns
+
+INDEX_VERSION = 1
+SLOTS = [("OBJETIVOPROFESIONAL1_COD", "OBJETIVOPROFESIONAL1_DESC"),
+         ("OBJETIVOPROFESIONAL2_COD", "OBJETIVOPROFESIONAL2_DESC"),
+         ("OBJETIVOPROFESIONAL3_COD", "OBJETIVOPROFESIONAL3_DESC")]
+_ARRAYS = ["codes", "offsets", "rows", "descriptions", "districts", "district_bits", "years", "year_bits"]
+
+
+def _labels(column) -> tuple[np.ndarray, np.ndarray]:
+    if isinstance(column, Categorical):
+        return column.codes, np.asarray(column.categories, dtype=str)
+    labels, codes = np.unique(np.asarray(column, dtype=str), return_inverse=True)
+    return codes.reshape(-1), labels
+
+
+def _bitmaps(groups: np.ndarray, count: int) -> np.ndarray:
+    '''
+    Packed bitmap of the records of each group, one row per group
+    '''
+    rows = np.arange(len(groups))
+    bits = np.zeros((count, (len(groups) + 7) // 8), dtype=np.uint8)
+    # Bit 7 - (row % 8) of byte row // 8, as np.packbits orders them
+    np.bitwise_or.at(bits, (groups, rows >> 3), (0x80 >> (rows & 7)).astype(np.uint8))
+    return bits
+
+
+class OccupationIndex:
+    '''
+    Records of every occupation code, district and year
+    Examples:
+        >>> data = empleo.parse_rows(['FECHA_INSCRIPCION', 'DISTRITO_DESC', 'OBJETIVOPROFESIONAL1_COD',
+        ...                           'OBJETIVOPROFESIONAL2_COD', 'OBJETIVOPROFESIONAL3_COD'],
+        ...                          [['ene-24', 'CENTRO', '5833', '9602', ''],
+        ...                           ['feb-24', 'LATINA', '9602', '', ''],
+        ...                           ['mar-23', 'CENTRO', '9602', '5833', '5833']])
+        >>> index = OccupationIndex.build(data)
+        >>> index.rows_for(5833)
+        array([0, 2], dtype=int32)
+        >>> index.query(9602, district='CENTRO', year=2024)
+        array([0], dtype=int32)
+        >>> index.top_occupations('CENTRO')
+        [(5833, '', 2), (9602, '', 2)]
+    '''
+    def __init__(self, size: int, arrays: dict[str, np.ndarray]) -> None:
+        self.size = size
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+        self._district_pos = {d: i for i, d in enumerate(self.districts.tolist())}
+        self._year_pos = {y: i for i, y in enumerate(self.years.tolist())}
+
+    @classmethod
+    def build(cls, data: EmploymentColumns) -> 'OccupationIndex':
+        '''
+        Index of some records, such as the ones of `empleo.load_employment_columnar`
+        '''
+        slots = [np.asarray(data[cod]).astype(np.int64) for cod, _ in SLOTS]
+        size = len(slots[0])
+        row_ids = np.tile(np.arange(size, dtype=np.int64), len(slots))
+        codes = np.concatenate(slots)
+        present = codes != 0
+        # Sorted (code, row) pairs, each only once even if a record repeats a code
+        pairs = np.unique(codes[present] * size + row_ids[present])
+        pair_codes, rows = np.divmod(pairs, max(size, 1))
+        unique_codes, starts = np.unique(pair_codes, return_index=True)
+        offsets = np.append(starts, len(rows)).astype(np.int64)
+        descriptions = np.full(len(unique_codes), '', dtype=object)
+        for cod, desc in reversed(SLOTS):
+            if desc in data:
+                values = np.asarray(data[desc], dtype=object)
+                column = np.asarray(data[cod]).astype(np.int64)
+                found = np.searchsorted(unique_codes, column)
+                known = (column != 0) & (found < len(unique_codes))
+                descriptions[found[known]] = values[known]
+        district_codes, districts = _labels(data['DISTRITO_DESC']) if 'DISTRITO_DESC' in data \
+            else (np.zeros(size, dtype=np.int64), np.array([''], dtype=str))
+        years, year_codes = np.unique(empleo.registration_years(data), return_inverse=True)
+        arrays = {"codes": unique_codes, "offsets": offsets, "rows": rows.astype(np.int32),
+                  "descriptions": descriptions.astype(str),
+                  "districts": np.asarray(districts, dtype=str),
+                  "district_bits": _bitmaps(np.asarray(district_codes), len(districts)),
+                  "years": years, "year_bits": _bitmaps(year_codes.reshape(-1), len(years))}
+        return cls(size, arrays)
+
+    def rows_for(self, code: int) -> np.ndarray:
+        '''
+        Sorted ids of the records with an occupation code in any slot
+        '''
+        pos = int(np.searchsorted(self.codes, code))
+        if pos == len(self.codes) or self.codes[pos] != code:
+            return np.zeros(0, dtype=np.int32)
+        return self.rows[self.offsets[pos]:self.offsets[pos + 1]]
+
+    def description(self, code: int) -> str:
+        pos = int(np.searchsorted(self.codes, code))
+        return str(self.descriptions[pos]) if pos < len(self.codes) and self.codes[pos] == code else ''
+
+    def _filter_bits(self, district: str | None, year: int | None) -> np.ndarray | None:
+        '''
+        Packed bitmap of the records of a district and a year, or None for all
+        '''
+        bits = None
+        if district is not None:
+            pos = self._district_pos.get(district)
+            bits = self.district_bits[pos] if pos is not None else np.zeros(self.district_bits.shape[1], np.uint8)
+        if year is not None:
+            pos = self._year_pos.get(year)
+            year_bits = self.year_bits[pos] if pos is not None else np.zeros(self.year_bits.shape[1], np.uint8)
+            bits = year_bits if bits is None else bits & year_bits
+        return bits
+
+    def query(self, codes: int | Iterable[int] | None = None, district: str | None = None,
+              year: int | None = None) -> np.ndarray:
+        '''
+        Sorted ids of the records that list any of some occupation codes, of
+        a district and of a registration year (each criterion is optional)
+        Args:
+            codes (int | Iterable[int]): occupation code or codes; any if None
+            district (str): district description, e.g. 'CENTRO'
+            year (int): registration year, e.g. 2024
+        Returns:
+            np.ndarray: ids (positions) of the records
+        '''
+        bits = self._filter_bits(district, year)
+        if codes is None:
+            if bits is None:
+                return np.arange(self.size, dtype=np.int32)
+            return np.flatnonzero(np.unpackbits(bits, count=self.size)).astype(np.int32)
+        if isinstance(codes, (int, np.integer)):
+            rows = self.rows_for(codes)
+        else:
+            rows = np.unique(np.concatenate([self.rows_for(c) for c in codes] or [np.zeros(0, np.int32)]))
+        if bits is None:
+            return rows
+        return rows[(bits[rows >> 3] >> (7 - (rows & 7))) & 1 == 1]
+
+    def top_occupations(self, district: str | None = None, n: int = 10,
+                        year: int | None = None) -> list[tuple[int, str, int]]:
+        '''
+        Occupation codes listed by the most records of a district (and year)
+        Returns:
+            list[tuple[int, str, int]]: code, description and number of records,
+                from the largest number (the smallest code first among ties)
+        '''
+        bits = self._filter_bits(district, year)
+        if len(self.codes) == 0:
+            return []
+        if bits is None:
+            counts = np.diff(self.offsets)
+        else:
+            selected = (bits[self.rows >> 3] >> (7 - (self.rows & 7))) & 1
+            counts = np.add.reduceat(selected.astype(np.int64), self.offsets[:-1])
+        order = np.lexsort((self.codes, -counts))[:n]
+        return [(int(self.codes[i]), str(self.descriptions[i]), int(counts[i]))
+                for i in order if counts[i]]
+
+    def top_by_district(self, n: int = 10, year: int | None = None) -> dict[str, list[tuple[int, str, int]]]:
+        '''
+        The top occupations of every district
+        '''
+        return {d: self.top_occupations(d, n, year) for d in self.districts.tolist()}
+
+    def save(self, folder: str) -> None:
+        for name in _ARRAYS:
+            np.save(os.path.join(folder, f"{name}.npy"), getattr(self, name))
+
+
+def index_dir_for(path: str) -> str:
+    '''
+    Default directory of the occupation index of a csv file
+    Examples:
+        >>> index_dir_for('data/inscritos.csv')
+        'data/inscritos.csv.occupations'
+    '''
+    return path + '.occupations'
+
+
+def save_index(index: OccupationIndex, path: str, index_dir: str | None = None) -> None:
+    '''
+    Stores the occupation index of a csv file next to it
+    '''
+    index_dir = index_dir or index_dir_for(path)
+    meta = {"version": INDEX_VERSION, **source_info(path), "blake2b": file_hash(path), "size_rows": index.size}
+    tmp = tempfile.mkdtemp(prefix='.tmp-', dir=os.path.dirname(os.path.abspath(index_dir)))
+    try:
+        index.save(tmp)
+        with open(os.path.join(tmp, "meta.json"), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        shutil.rmtree(index_dir, ignore_errors=True)
+        os.replace(tmp, index_dir)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def load_occupation_index(path: str, index_dir: str | None = None) -> OccupationIndex:
+    '''
+    Occupation index of a csv file, built only if it is missing or out of date
+    Args:
+        path (str): path of the csv file
+        index_dir (str): directory of the index, by default the one of `index_dir_for`
+    Returns:
+        OccupationIndex: the index, memory-mapped
+    Example:
+        >>> index = load_occupation_index('inscritos.csv')     # doctest: +SKIP
+        >>> len(index.query(5833, district='CENTRO', year=2024))  # doctest: +SKIP
+        31
+    '''
+    index_dir = index_dir or index_dir_for(path)
+    meta = read_meta(path, index_dir, "meta.json", INDEX_VERSION)
+    if meta is None:
+        index = OccupationIndex.build(empleo.load_employment_columnar(path))
+        save_index(index, path, index_dir)
+        size = index.size
+    else:
+        size = meta["size_rows"]
+    arrays = {name: load_array(os.path.join(index_dir, f"{name}.npy")) for name in _ARRAYS}
+    return OccupationIndex(size, arrays)
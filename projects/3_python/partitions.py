@@ -0,0 +1,237 @@
+"""
+Year-partitioned storage of employment CSV files.
+
+The parsed columns are split by the year of FECHA_INSCRIPCION and stored as
+one directory of .npy files per year (and one named "missing" for the
+records without a date), in the format of `cache.write_columns`,
+next to a manifest.json with the row count and the first and last FX_CARGA
+of every partition. The descriptions are stored as codes of a vocabulary
+shared by all the partitions.
+
+Readers choose the partitions from the manifest before opening any file, so
+the queries of a year (`filter_year`, `show_by_month`, `show_district` in
+02_pandas) read only the rows of that year. As with `cache`, the partitions
+are rebuilt when the csv file changes.
+"""
+import json
+import os
+import shutil
+import tempfile
+from typing import Iterable, Sequence
+
+import numpy as np
+import pandas as pd
+
+import empleo
+from cache import file_hash, read_columns, read_meta, source_info, write_columns
+from dataframes import DERIVED_COLUMNS, DataFrame
+from empleo import Categorical, EmploymentColumns
+
+PARTITIONS_VERSION = 4
+# Partition of the records without FECHA_INSCRIPCION (parsed as 1970-01)
+MISSING_DATE = "missing"
+# Columns whose missing values are stored as 0 and are NaN in a DataFrame
+_NULLABLE_INT_COLUMNS = {"EDAD", "OBJETIVOPROFESIONAL1_COD", "OBJETIVOPROFESIONAL2_COD",
+                         "OBJETIVOPROFESIONAL3_COD"}
+
+
+def partitions_dir_for(path: str) -> str:
+    '''
+    Default partitions directory of a csv file: the file name plus '.parts'
+    Examples:
+        >>> partitions_dir_for('data/inscritos.csv')
+        'data/inscritos.csv.parts'
+    '''
+    return path + '.parts'
+
+
+def write_partitions(data: EmploymentColumns, path: str, parts_dir: str | None = None) -> dict:
+    '''
+    Stores the parsed columns of a csv file split by registration year
+    Args:
+        data (EmploymentColumns): the columns loaded from `path`
+        path (str): path of the csv file the columns come from
+        parts_dir (str): partitions directory, by default the one of `partitions_dir_for`
+    Returns:
+        dict: the manifest of the partitions
+    '''
+    parts_dir = parts_dir or partitions_dir_for(path)
+    manifest = {"version": PARTITIONS_VERSION, **source_info(path), "blake2b": file_hash(path),
+                "columns": {}, "categories": {}, "partitions": {},
+                "missing": {col: int(np.count_nonzero(np.asarray(data[col]) == 0))
+                            for col in sorted(_NULLABLE_INT_COLUMNS) if col in data}}
+    years = empleo.registration_years(data)
+    order = np.argsort(years, kind='stable')
+    labels, starts = np.unique(years[order], return_index=True)
+    parent = os.path.dirname(os.path.abspath(parts_dir))
+    tmp = tempfile.mkdtemp(prefix='.tmp-', dir=parent)
+    try:
+        for year, rows in zip(labels.tolist(), np.split(order, starts[1:])):
+            key = MISSING_DATE if year == 1970 else str(year)
+            os.mkdir(os.path.join(tmp, key))
+            # The rows of a Categorical keep its vocabulary, the same for all the years
+            manifest.update(write_columns({col: values[rows] for col, values in data.items()},
+                                          os.path.join(tmp, key)))
+            fx_carga = np.asarray(data['FX_CARGA'])[rows]
+            manifest["partitions"][key] = {"rows": len(rows),
+                                                 "fx_carga_min": str(fx_carga.min()),
+                                                 "fx_carga_max": str(fx_carga.max())}
+        with open(os.path.join(tmp, "manifest.json"), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        shutil.rmtree(parts_dir, ignore_errors=True)
+        os.replace(tmp, parts_dir)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return manifest
+
+
+def read_manifest(path: str, parts_dir: str | None = None, workers: int = 1) -> dict:
+    '''
+    Manifest of the partitions of a csv file, which are built (or rebuilt if
+    the file changed) when needed
+    Args:
+        path (str): path of the csv file
+        parts_dir (str): partitions directory, by default the one of `partitions_dir_for`
+        workers (int): number of processes used if the file has to be parsed
+    Returns:
+        dict: rows and first and last FX_CARGA of each year (and of MISSING_DATE)
+            under "partitions"
+    Example:
+        >>> read_manifest('inscritos.csv')['partitions']['2022']  # doctest: +SKIP
+        {'rows': 14823, 'fx_carga_min': '2025-08-07T00:11:57.897000', 'fx_carga_max': '2025-08-07T00:11:57.897000'}
+    '''
+    parts_dir = parts_dir or partitions_dir_for(path)
+    manifest = read_meta(path, parts_dir, "manifest.json", PARTITIONS_VERSION)
+    if manifest is None:
+        manifest = write_partitions(empleo.load_employment_columnar(path, workers), path, parts_dir)
+    return manifest
+
+
+def load_partitions(path: str, years: Iterable[int] | None = None,
+                    columns: Sequence[str] | None = None,
+                    parts_dir: str | None = None) -> EmploymentColumns:
+    '''
+    Memory-maps the columns of the records of some registration years
+    Args:
+        path (str): path of the csv file
+        years (Iterable[int]): years wanted (e.g. 2022); all of them, and the
+            records without a date, if None
+        columns (Sequence[str]): columns wanted; all of them if None
+        parts_dir (str): partitions directory, by default the one of `partitions_dir_for`
+    Returns:
+        EmploymentColumns: the columns of the records of those years, in file
+            order within each year
+    Example:
+        >>> len(load_partitions('inscritos.csv', [2022])['EDAD'])  # doctest: +SKIP
+        14823
+    '''
+    parts_dir = parts_dir or partitions_dir_for(path)
+    manifest = read_manifest(path, parts_dir)
+    wanted = set(years) if years is not None else None
+    # The year predicate only looks at the manifest
+    selected = [y for y in manifest["partitions"]
+                if wanted is None or (y != MISSING_DATE and int(y) in wanted)]
+    meta = {"columns": {col: kind for col, kind in manifest["columns"].items()
+                        if columns is None or col in columns},
+            "categories": manifest["categories"]}
+    parts = [read_columns(os.path.join(parts_dir, y), meta) for y in selected]
+    if len(parts) == 1:
+        return parts[0]
+    data = empleo.concat_columns(parts)
+    return {col: values for col, values in data.items() if columns is None or col in columns}
+
+
+def _category(column: Categorical) -> pd.Categorical:
+    # Empty descriptions are missing values, as in read_csv
+    categories = np.asarray(column.categories)
+    present = categories != ''
+    recode = np.where(present, np.cumsum(present) - 1, -1)
+    return pd.Categorical.from_codes(recode[column.codes], categories[present])
+
+
+def _month_labels(months: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    FECHA_INSCRIPCION ('ene-22'), MES_INSCRIPCION and ANYO_INSCRIPCION of
+    each month, formatted once per distinct month. Missing dates (1970-01)
+    give NaN, NaN and 0, as in `dataframes.load_dataframe`.
+    '''
+    months = months.astype('datetime64[M]').astype(np.int64)
+    uniques, inverse = np.unique(months, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    names = np.array([empleo.MONTHS[m % 12] for m in uniques.tolist()], dtype=object)
+    years = (uniques // 12 + 1970) % 100
+    labels = np.array([f"{n}-{y:02d}" for n, y in zip(names, years.tolist())], dtype=object)
+    missing = uniques == 0
+    names[missing], labels[missing], years[missing] = np.nan, np.nan, 0
+    return labels[inverse], names[inverse], years[inverse].astype(np.int64)
+
+
+def to_dataframe(data: EmploymentColumns, missing: Iterable[str] | None = None) -> DataFrame:
+    '''
+    DataFrame with the columns of `dataframes.load_dataframe` (the ones in
+    the data), with the descriptions as categories.
+    The parsed columns keep a missing age or code as 0. In the columns of
+    `missing` the zeros become NaN (and the column float), as read_csv does
+    with empty fields; no valid age or code is 0, so this only differs from
+    read_csv for a csv with a literal '0' in them.
+    Args:
+        data (EmploymentColumns): the columns
+        missing (Iterable[str]): columns of ages or codes with missing values;
+            by default the ones with some 0 in `data`
+    Returns:
+        DataFrame: the records
+    Examples:
+        >>> data = empleo.parse_rows(['FECHA_INSCRIPCION', 'DISTRITO_DESC', 'EDAD'],
+        ...                          [['ene-22', ' CENTRO', '30'], ['feb-22', ' RETIRO', ''],
+        ...                           ['', ' LATINA', '40']])
+        >>> to_dataframe(data)[['DISTRITO_DESC', 'EDAD', 'MES_INSCRIPCION', 'ANYO_INSCRIPCION']]
+          DISTRITO_DESC  EDAD MES_INSCRIPCION  ANYO_INSCRIPCION
+        0        CENTRO  30.0             ene                22
+        1        RETIRO   NaN             feb                22
+        2        LATINA  40.0             NaN                 0
+    '''
+    if missing is None:
+        missing = [col for col in _NULLABLE_INT_COLUMNS if col in data and (np.asarray(data[col]) == 0).any()]
+    missing = set(missing) & _NULLABLE_INT_COLUMNS
+    frame = {}
+    for col, values in data.items():
+        if isinstance(values, Categorical):
+            frame[col] = _category(values)
+        elif col == 'FECHA_INSCRIPCION':
+            frame[col], month, year = _month_labels(np.asarray(values))
+        elif col == 'FX_CARGA':
+            frame[col] = np.asarray(values).astype('datetime64[ns]')
+        elif col in missing:
+            frame[col] = np.where(np.asarray(values) == 0, np.nan, values)
+        else:
+            frame[col] = np.asarray(values).astype(np.int64)
+    if 'FECHA_INSCRIPCION' in data:
+        frame['MES_INSCRIPCION'], frame['ANYO_INSCRIPCION'] = month, year
+    return pd.DataFrame(frame)
+
+
+def load_year(path: str, year: int, columns: Sequence[str] | None = None,
+              parts_dir: str | None = None) -> DataFrame:
+    '''
+    Records of a registration year, as `filter_year(load_dataframe(path), year)`
+    but reading only the partition of that year
+    Args:
+        path (str): path of the csv file
+        year (int): registration year, e.g. 2022
+        columns (Sequence[str]): columns wanted; all of them if None
+        parts_dir (str): partitions directory, by default the one of `partitions_dir_for`
+    Returns:
+        DataFrame: the records of the year, with the descriptions as categories
+    Example:
+        >>> load_year('inscritos.csv', 2022)['ANYO_INSCRIPCION'].unique()  # doctest: +SKIP
+        array([22])
+    '''
+    # A column with missing values in the file is float in every year, as in load_dataframe
+    missing = [col for col, n in read_manifest(path, parts_dir)["missing"].items() if n]
+    read = None
+    if columns is not None:
+        read = [c for c in empleo.COLUMNS
+                if c in columns or (c == 'FECHA_INSCRIPCION' and set(columns) & set(DERIVED_COLUMNS))]
+    data = to_dataframe(load_partitions(path, [year], read, parts_dir), missing)
+    return data if columns is None else data[list(columns)]
@@ -0,0 +1,172 @@
+"""
+Peak queries over the year x month registration matrix of `year_month_data`.
+
+`max_requests` in 01_python only gives the global peak and needs two passes
+(np.max and np.argmax). The functions here give the top-K months, the peak
+of every year or district and the peaks after a given year with a single
+np.argpartition / np.argmax. `PeakTracker` keeps the top-K months up to
+date while new months are added, without looking at the whole history.
+
+Results are tuples (year, month, value) with the month as in `max_requests`:
+'ene', 'feb', ... 'dic'. Ties are resolved in favour of the earliest month.
+"""
+import numpy as np
+
+from empleo import MONTHS
+
+
+def _top_indices(values: np.ndarray, k: int) -> np.ndarray:
+    '''
+    Indices of the k largest values, from largest to smallest (the earliest
+    index first among equal values)
+    '''
+    n = len(values)
+    k = min(k, n)
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    # Unique keys: equal values are ordered by position, so argpartition is exact
+    keys = values.astype(np.int64) * n + (n - 1 - np.arange(n))
+    top = np.argpartition(-keys, k - 1)[:k]
+    return top[np.argsort(-keys[top])]
+
+
+def top_k_months(matrix: np.array, start_year: int, k: int,
+                 from_year: int | None = None) -> list[tuple[int, str, int]]:
+    '''
+    Months with the most registrations
+    Args:
+        matrix (np.ndarray): registrations, a row per year and a column per month
+        start_year (int): year of row 0
+        k (int): number of months wanted
+        from_year (int): only months of this year or later, if given
+    Returns:
+        list[tuple[int, str, int]]: year, month and value of each month, from the largest value
+    Examples:
+        >>> m = np.array([[9, 10, 9, 10, 3, 20, 17, 10, 7, 7, 23, 15],
+        ...               [12, 17, 15, 11, 11, 13, 15, 4, 12, 24, 14, 17]])
+        >>> top_k_months(m, 2020, 3)
+        [(2021, 'oct', 24), (2020, 'nov', 23), (2020, 'jun', 20)]
+        >>> top_k_months(m, 2020, 2, from_year=2021)
+        [(2021, 'oct', 24), (2021, 'feb', 17)]
+    '''
+    first_row = max(0, from_year - start_year) if from_year is not None else 0
+    flat = np.asarray(matrix)[first_row:].reshape(-1)
+    return [(int(start_year + first_row + i // 12), MONTHS[i % 12], int(flat[i]))
+            for i in _top_indices(flat, k)]
+
+
+def max_requests(matrix: np.array, start_year: int) -> tuple[int, str, int]:
+    '''
+    Year, month and value of the month with the most registrations, with a
+    single pass over the matrix
+    Examples:
+        >>> max_requests(np.array([[1, 5, 2], [5, 0, 0]]), 2020)
+        (2020, 'feb', 5)
+    '''
+    matrix = np.asarray(matrix)
+    pos = int(np.argmax(matrix))
+    row, col = divmod(pos, matrix.shape[1])
+    return start_year + row, MONTHS[col], int(matrix.reshape(-1)[pos])
+
+
+def peaks_by_year(matrix: np.array, start_year: int) -> list[tuple[int, str, int]]:
+    '''
+    Month with the most registrations of every year
+    Examples:
+        >>> peaks_by_year(np.array([[1, 5, 2], [5, 0, 0]]), 2020)
+        [(2020, 'feb', 5), (2021, 'ene', 5)]
+    '''
+    matrix = np.asarray(matrix)
+    cols = np.argmax(matrix, axis=1)
+    values = matrix[np.arange(len(matrix)), cols]
+    return [(start_year + row, MONTHS[col], int(value))
+            for row, (col, value) in enumerate(zip(cols, values))]
+
+
+def peaks_by_group(counts: np.ndarray, groups, start_year: int) -> dict:
+    '''
+    Month with the most registrations of every group (e.g. district)
+    Args:
+        counts (np.ndarray): registrations with shape (groups, years, 12), such as
+            a cube over ['DISTRITO_DESC', 'year', 'month']
+        groups: label of each group
+        start_year (int): year of the first row of each group
+    Returns:
+        dict: year, month and value of the peak of each group
+    Examples:
+        >>> counts = np.array([[[1, 0], [0, 2]], [[3, 0], [0, 0]]])
+        >>> peaks_by_group(np.pad(counts, ((0, 0), (0, 0), (0, 10))), ['A', 'B'], 2020)
+        {'A': (2021, 'feb', 2), 'B': (2020, 'ene', 3)}
+    '''
+    flat = np.asarray(counts).reshape(len(groups), -1)
+    pos = np.argmax(flat, axis=1)
+    values = flat[np.arange(len(flat)), pos]
+    return {group: (int(start_year + p // 12), MONTHS[p % 12], int(v))
+            for group, p, v in zip(groups, pos, values)}
+
+
+class PeakTracker:
+    '''
+    Top-K months and peak of every year, updated month by month
+    Args:
+        k (int): number of top months kept
+    Examples:
+        >>> tracker = PeakTracker(2)
+        >>> tracker.extend(np.array([[9, 10, 9, 10, 3, 20, 17, 10, 7, 7, 23, 15]]), 2020)
+        >>> tracker.update(2021, 1, 30)
+        >>> tracker.top()
+        [(2021, 'ene', 30), (2020, 'nov', 23)]
+        >>> tracker.year_peak(2020)
+        (2020, 'nov', 23)
+    '''
+    def __init__(self, k: int) -> None:
+        self.k = k
+        self.values: dict[tuple[int, int], int] = {}
+        self._top: list[tuple[int, int, int]] = []
+        self._year_peaks: dict[int, tuple[int, int]] = {}
+
+    @staticmethod
+    def _key(year: int, month: int, value: int) -> tuple[int, int, int]:
+        # Larger values first; earlier months first among equal values
+        return (-value, year, month)
+
+    def update(self, year: int, month: int, value: int) -> None:
+        '''
+        Sets the number of registrations of a month (1 to 12), new or already seen
+        '''
+        old = self.values.get((year, month))
+        self.values[(year, month)] = value
+        if old is not None and value < old:
+            # A count went down: only then the whole history is looked at again
+            self._top = sorted(self._key(y, m, v) for (y, m), v in self.values.items())[:self.k]
+            months = [(m, v) for (y, m), v in self.values.items() if y == year]
+            self._year_peaks[year] = min(months, key=lambda mv: (-mv[1], mv[0]))
+            return
+        entry = self._key(year, month, value)
+        self._top = [e for e in self._top if (e[1], e[2]) != (year, month)]
+        if len(self._top) < self.k or entry < self._top[-1]:
+            self._top = sorted(self._top + [entry])[:self.k]
+        peak = self._year_peaks.get(year)
+        if peak is None or (-value, month) < (-peak[1], peak[0]) or peak[0] == month:
+            self._year_peaks[year] = (month, value)
+
+    def extend(self, matrix: np.array, start_year: int) -> None:
+        '''
+        Adds the months of a year x month matrix
+        '''
+        for row, counts in enumerate(np.asarray(matrix).tolist()):
+            for month, value in enumerate(counts, 1):
+                self.update(start_year + row, month, value)
+
+    def top(self) -> list[tuple[int, str, int]]:
+        '''
+        The top-K months, from the largest value
+        '''
+        return [(year, MONTHS[month - 1], -value) for value, year, month in self._top]
+
+    def year_peak(self, year: int) -> tuple[int, str, int]:
+        '''
+        Month with the most registrations of a year
+        '''
+        month, value = self._year_peaks[year]
+        return year, MONTHS[month - 1], value
@@ -0,0 +1,160 @@
+"""
+Precomputed counts and batch rendering of the charts of 02_pandas.
+
+`show_by_month` and `show_district` load, filter and group the whole csv
+file for every chart. Here the registrations per (year, month) and per
+(year, district) are counted once from `load_columns` and stored in a
+json file next to the csv, which is rebuilt when the csv changes. All the
+charts of a report are then drawn from those counts and written as PNG
+files, optionally in a process pool.
+
+matplotlib is only needed to render the charts. Figures are created without
+pyplot, so none of them stays open after it is saved.
+"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable
+
+import empleo
+from cache import file_hash, read_meta, source_info
+from dataframes import DataFrame, load_columns
+
+AGGREGATES_VERSION = 2
+OTHER_DISTRICT = 'OTRO MUNICIPIO'
+
+
+def aggregates_path_for(path: str) -> str:
+    '''
+    Default file of the counts of a csv file
+    Examples:
+        >>> aggregates_path_for('data/inscritos.csv')
+        'data/inscritos.csv.aggregates.json'
+    '''
+    return path + '.aggregates.json'
+
+
+def build_aggregates(data: DataFrame) -> dict:
+    '''
+    Registrations per year and month and per year and district
+    Args:
+        data (DataFrame): the records, as returned by `load_dataframe`
+    Returns:
+        dict: for each year (e.g. '2022'), a list of (month, total) sorted by
+            month under "by_month" and a list of (district, total) under "by_district";
+            the records without a date are not counted
+    Examples:
+        >>> import pandas as pd
+        >>> data = pd.DataFrame({'MES_INSCRIPCION': ['feb', 'ene', 'feb'], 'ANYO_INSCRIPCION': [22, 22, 23],
+        ...                      'DISTRITO_DESC': ['CENTRO', 'CENTRO', 'RETIRO']})
+        >>> build_aggregates(data)['by_month']
+        {'2022': [('ene', 1), ('feb', 1)], '2023': [('feb', 1)]}
+    '''
+    data = data[data['MES_INSCRIPCION'].notna()]
+    years = (2000 + data['ANYO_INSCRIPCION']).astype(str)
+    aggregates = {"by_month": {}, "by_district": {}}
+    months = data.groupby([years, data['MES_INSCRIPCION']], observed=True).size()
+    for (year, month), total in months.items():
+        aggregates["by_month"].setdefault(year, []).append((month, int(total)))
+    for counts in aggregates["by_month"].values():
+        counts.sort(key=lambda mt: empleo.MONTHS.index(mt[0]))
+    districts = data.groupby([years, data['DISTRITO_DESC']], observed=True).size()
+    for (year, district), total in districts.items():
+        aggregates["by_district"].setdefault(year, []).append((district, int(total)))
+    return aggregates
+
+
+def load_aggregates(path: str, aggregates_path: str | None = None) -> dict:
+    '''
+    Counts of a csv file, computed only if they are missing or out of date
+    Args:
+        path (str): path of the csv file
+        aggregates_path (str): file of the counts, by default the one of `aggregates_path_for`
+    Returns:
+        dict: the counts, as in `build_aggregates`
+    Example:
+        >>> load_aggregates('inscritos.csv')['by_month']['2023'][0]  # doctest: +SKIP
+        ('ene', 1869)
+    '''
+    aggregates_path = aggregates_path or aggregates_path_for(path)
+    folder, filename = os.path.split(aggregates_path)
+    meta = read_meta(path, folder or '.', filename, AGGREGATES_VERSION)
+    if meta is None:
+        data = load_columns(path, ['DISTRITO_DESC', 'MES_INSCRIPCION', 'ANYO_INSCRIPCION'])
+        meta = {"version": AGGREGATES_VERSION, **source_info(path), "blake2b": file_hash(path),
+                **build_aggregates(data)}
+        with open(aggregates_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+    return {kind: {year: [tuple(c) for c in counts] for year, counts in meta[kind].items()}
+            for kind in ("by_month", "by_district")}
+
+
+def _figure():
+    from matplotlib.figure import Figure
+    return Figure(figsize=(8, 6))
+
+
+def render_by_month(counts: list[tuple[str, int]], year: int, filename: str) -> str:
+    '''
+    Bar chart of the registrations per month of a year, saved as a PNG file
+    '''
+    fig = _figure()
+    ax = fig.subplots()
+    ax.bar([m for m, _ in counts], [t for _, t in counts])
+    ax.set_title(f'Inscritos por mes en {year}')
+    ax.set_xlabel('Mes')
+    ax.set_ylabel('Inscritos')
+    fig.savefig(filename)
+    return filename
+
+
+def render_district(counts: list[tuple[str, int]], year: int, filename: str) -> str:
+    '''
+    Pie chart of the registrations per district of Madrid in a year, saved as
+    a PNG file; the chart is empty if there are none
+    '''
+    counts = [(d, t) for d, t in counts if d != OTHER_DISTRICT and t > 0]
+    fig = _figure()
+    ax = fig.subplots()
+    if counts:
+        ax.pie([t for _, t in counts], labels=[d for d, _ in counts], autopct='%1.1f%%')
+    else:
+        ax.axis('off')
+    ax.set_title(f'Inscritos por distrito en {year}')
+    fig.savefig(filename)
+    return filename
+
+
+_RENDERERS = {"by_month": render_by_month, "by_district": render_district}
+
+
+def _render(job: tuple[str, list, int, str]) -> str:
+    kind, counts, year, filename = job
+    return _RENDERERS[kind](counts, year, filename)
+
+
+def render_all(path: str, out_dir: str, years: Iterable[int] | None = None,
+               workers: int = 1) -> list[str]:
+    '''
+    Writes the charts by month and by district of several years
+    Args:
+        path (str): path of the csv file
+        out_dir (str): directory of the PNG files, e.g. 'by_month_2022.png'
+        years (Iterable[int]): years wanted; all the years in the file if None
+        workers (int): number of processes that draw the charts
+    Returns:
+        list[str]: names of the files written
+    Example:
+        >>> render_all('inscritos.csv', 'report', [2022, 2023], workers=4)  # doctest: +SKIP
+        ['report/by_month_2022.png', 'report/by_district_2022.png', 'report/by_month_2023.png', 'report/by_district_2023.png']
+    '''
+    aggregates = load_aggregates(path)
+    years = sorted(int(y) for y in aggregates["by_month"]) if years is None else list(years)
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = [(kind, aggregates[kind].get(str(year), []), year,
+             os.path.join(out_dir, f"{kind}_{year}.png"))
+            for year in years for kind in _RENDERERS]
+    if workers <= 1:
+        return [_render(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_render, jobs))
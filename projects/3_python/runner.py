@@ -0,0 +1,351 @@
+"""
+Runner of the checks of `testing`.
+
+In the notebooks every check is called from its own cell, loads the data
+files again and gets some of its inputs through the globals of `testing`
+(DATAFILE, TESTDATAFILE, LOAD_EMPLOYMENT). `run_checks` finds all the
+`test_*` checks, binds each parameter to the implementation with the same
+name (or to an explicit binding) and runs them:
+
+- The checks are copies of the ones of `testing` that see the files and the
+  loader of the run as their globals; the module itself is not changed.
+- The loaders of the implementations are memoized by file and file state and
+  the datasets the selected checks use are loaded once in the main process,
+  before the workers are forked, so all the checks share them. DataFrames
+  are handed out as shallow copies and the arrays of other results as
+  read-only views.
+- `test_docstring` and `test_doctests` run once for every documented function
+  of the notebooks that is implemented.
+- Checks that use an implementation that writes files (samples, caches,
+  partitions, databases) run one after the other; the rest run in a process
+  pool.
+- The output of each check, including the one of its doctests, is captured
+  separately and reported with its time.
+"""
+import contextlib
+import copy
+import functools
+import inspect
+import io
+import multiprocessing
+import os
+import time
+import traceback
+import types
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+import testing
+
+LOADERS = ('load_employment', 'load_employment_columnar', 'load_dataframe')
+# Implementations that create or replace files: the checks that use them
+# cannot run at the same time
+WRITERS = {'gen_sample', 'gen_samples', 'load_employment_cached', 'write_partitions',
+           'load_partitions', 'load_year', 'load_aggregates', 'render_all', 'load_sqlite',
+           'ingest', 'load_occupation_index'}
+# Functions of the notebooks checked by test_docstring and test_doctests
+DOCUMENTED = ('gen_sample', 'str2int', 'str2dt', 'str2my', 'add_row', 'load_employment',
+              'people_by_district', 'mean_age_by_district', 'year_month_data',
+              'sum_by_month_year', 'max_requests', 'by_quarters',
+              'load_dataframe', 'reduce_cols', 'filter_year', 'by_month')
+_PER_FUNCTION = ('test_docstring', 'test_doctests')
+# Setup functions of testing, not checks
+_SETUP = {'test_datafile'}
+_SUFFIXES = ('_typehints',)
+_PREFIXES = ('test_type_hints_', 'test_')
+
+
+class CheckResult(NamedTuple):
+    name: str
+    status: str
+    seconds: float
+    output: str
+    error: str = ''
+
+
+def implementation_name(check: str) -> str:
+    '''
+    Name of the function tested by a check
+    Examples:
+        >>> implementation_name('test_mean_age_by_district_typehints')
+        'mean_age_by_district'
+        >>> implementation_name('test_type_hints_filter_year')
+        'filter_year'
+    '''
+    name = check
+    for prefix in _PREFIXES:
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+            break
+    for suffix in _SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+
+def _read_only(value, memo: dict | None = None):
+    '''
+    Version of a shared result that the checks cannot change: shallow copies
+    of DataFrames, dicts and lists (of scalars), read-only views of arrays.
+    An object shared by several columns (e.g. a vocabulary) gives a single
+    view, so the columns still share it.
+    '''
+    memo = {} if memo is None else memo
+    if id(value) in memo:
+        return memo[id(value)]
+    if isinstance(value, pd.DataFrame):
+        result = value.copy(deep=False)
+    elif isinstance(value, np.ndarray):
+        result = value.view()
+        result.flags.writeable = False
+    elif isinstance(value, dict):
+        result = {k: _read_only(v, memo) for k, v in value.items()}
+    elif isinstance(value, list):
+        result = list(value)
+    elif isinstance(value, tuple):
+        result = tuple(_read_only(v, memo) for v in value)
+    elif hasattr(value, '__dict__') and not callable(value):
+        # Columns such as empleo.Categorical: a copy with read-only arrays
+        result = copy.copy(value)
+        for name, attr in vars(result).items():
+            if isinstance(attr, np.ndarray):
+                setattr(result, name, _read_only(attr, memo))
+    else:
+        return value
+    memo[id(value)] = result
+    return result
+
+
+def _file_state(path) -> tuple[int, int] | None:
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError, ValueError):
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def shared_loader(load: Callable) -> Callable:
+    '''
+    Memoized version of a loader, so each file is loaded once while it does
+    not change (same size and modification time). The result is shared, so
+    it is handed out as in `_read_only`.
+    '''
+    results = {}
+
+    @functools.wraps(load)
+    def wrapper(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())), _file_state(args[0]) if args else None)
+        if key not in results:
+            results[key] = load(*args, **kwargs)
+        return _read_only(results[key])
+    return wrapper
+
+
+def find_checks(module=testing) -> dict[str, Callable]:
+    '''
+    The checks of a module: its functions whose name starts with 'test_'
+    '''
+    return {name: fun for name, fun in inspect.getmembers(module, inspect.isfunction)
+            if name.startswith('test_') and name not in _SETUP and fun.__module__ == module.__name__}
+
+
+def with_globals(module, overrides: dict) -> dict[str, Callable]:
+    '''
+    Copies of the functions of a module that see some of its globals
+    replaced; the module and its functions are not changed
+    Examples:
+        >>> checks = with_globals(testing, {'TESTDATAFILE': 'other.csv'})
+        >>> checks['test_datafile'].__globals__['TESTDATAFILE']
+        'other.csv'
+        >>> hasattr(testing, 'TESTDATAFILE') and testing.TESTDATAFILE == 'other.csv'
+        False
+    '''
+    namespace = {**vars(module), **overrides}
+    functions = {}
+    for name, fun in vars(module).items():
+        if inspect.isfunction(fun) and fun.__module__ == module.__name__:
+            copied = types.FunctionType(fun.__code__, namespace, fun.__name__, fun.__defaults__,
+                                        fun.__closure__)
+            copied.__kwdefaults__ = fun.__kwdefaults__
+            functions[name] = namespace[name] = functools.update_wrapper(copied, fun)
+    return functions
+
+
+def bind(check: Callable, implementations: dict, bindings: dict | None = None) -> dict | None:
+    '''
+    Arguments of a check, or None if some implementation it needs is missing.
+    A parameter takes its value from `bindings`, then from the implementation
+    with its name; a parameter named 'fun' takes the function the check tests.
+    '''
+    bindings = bindings or {}
+    arguments = {}
+    for param in inspect.signature(check).parameters.values():
+        if param.name in bindings:
+            arguments[param.name] = bindings[param.name]
+        elif param.name in implementations:
+            arguments[param.name] = implementations[param.name]
+        elif param.name == 'fun' and implementation_name(check.__name__) in implementations:
+            arguments[param.name] = implementations[implementation_name(check.__name__)]
+        elif param.default is inspect.Parameter.empty:
+            return None
+    return arguments
+
+
+# Bound checks of the current run, inherited by the forked workers
+_JOBS: dict[str, tuple[Callable, dict]] = {}
+
+
+def _timed(name: str, call: Callable[[], object]) -> CheckResult:
+    '''
+    Status, time and output of a call without arguments
+    '''
+    out = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(out):
+            call()
+    except unittest.SkipTest as e:
+        # A check that cannot run here, e.g. without an optional dependency
+        return CheckResult(name, 'SKIP', time.perf_counter() - start, out.getvalue(), str(e))
+    except Exception as e:
+        status = 'FAIL' if isinstance(e, AssertionError) else 'ERROR'
+        return CheckResult(name, status, time.perf_counter() - start, out.getvalue(),
+                           ''.join(traceback.format_exception_only(type(e), e)).strip())
+    return CheckResult(name, 'OK', time.perf_counter() - start, out.getvalue())
+
+
+def _run(name: str) -> CheckResult:
+    check, arguments = _JOBS[name]
+    return _timed(name, functools.partial(check, **arguments))
+
+
+def _global_names(code: types.CodeType) -> set[str]:
+    '''
+    Global names used by some code, including its nested functions
+    '''
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _global_names(const)
+    return names
+
+
+def _preloads(jobs: Iterable[tuple[Callable, dict]], implementations: dict,
+              files: dict[str, str]) -> set[tuple[str, str]]:
+    '''
+    (loader, path) pairs that some of the checks use: a loader passed to a
+    check (or LOAD_EMPLOYMENT) with a data file of its globals
+    '''
+    needed = set()
+    for check, arguments in jobs:
+        names = _global_names(check.__code__)
+        paths = {path for name, path in files.items() if name in names}
+        loaders = {loader for loader in LOADERS if loader in implementations
+                   and (any(arg is implementations[loader] for arg in arguments.values())
+                        or (loader == 'load_employment' and 'LOAD_EMPLOYMENT' in names))}
+        needed |= {(loader, path) for loader in loaders for path in paths}
+    return needed
+
+
+def _runs(name: str, check: Callable, implementations: dict, bindings: dict | None) -> dict[str, dict]:
+    '''
+    Arguments of every run of a check, by run name. Without explicit bindings,
+    `test_docstring` and `test_doctests` run once for every function of
+    DOCUMENTED, e.g. 'test_docstring[by_month]'.
+    '''
+    if name not in _PER_FUNCTION or bindings is not None:
+        arguments = bind(check, implementations, bindings)
+        return {} if arguments is None else {name: arguments}
+    runs = {}
+    for fun_name in DOCUMENTED:
+        if callable(implementations.get(fun_name)):
+            fun = inspect.unwrap(implementations[fun_name])
+            runs[f"{name}[{fun_name}]"] = bind(check, implementations,
+                                               {'fun': fun, 'globals': fun.__globals__})
+    return runs
+
+
+def run_checks(implementations: dict, datafile: str = 'inscritos.csv',
+               testdatafile: str = 'inscritos_test_sample.csv',
+               bindings: dict[str, dict] | None = None, only: set[str] | None = None,
+               workers: int = 1, verbose: bool = True) -> list[CheckResult]:
+    '''
+    Runs the checks of `testing` against some implementations
+    Args:
+        implementations (dict): functions under test by name, e.g. globals() of a notebook
+        datafile (str): the full data file
+        testdatafile (str): the small data file
+        bindings (dict[str, dict]): explicit arguments of some checks, by check
+            and parameter name, e.g. {'test_docstring': {'fun': by_month}}
+        only (set[str]): names of the checks to run; all the ones that can be bound if None
+        workers (int): number of processes that run the checks
+        verbose (bool): whether to print a line per check and the total time
+    Returns:
+        list[CheckResult]: status ('OK', 'FAIL', 'ERROR' or 'SKIP', also for the
+            checks that raise unittest.SkipTest), time,
+            output and error of each check, and of each dataset that could
+            not be loaded, in alphabetical order
+    Example:
+        >>> results = run_checks(globals(), workers=4)  # doctest: +SKIP
+        test_by_month                            OK       0.004s
+        ...
+    '''
+    implementations = {name: shared_loader(fun) if name in LOADERS and callable(fun) else fun
+                       for name, fun in implementations.items()}
+    bindings = bindings or {}
+    overrides = {'DATAFILE': datafile, 'TESTDATAFILE': testdatafile}
+    if 'load_employment' in implementations:
+        overrides['LOAD_EMPLOYMENT'] = implementations['load_employment']
+    checks = with_globals(testing, overrides)
+    writers = [implementations[name] for name in WRITERS if name in implementations]
+    jobs, serial, skipped = {}, set(), []
+    for name in find_checks():
+        if only is not None and name not in only:
+            continue
+        runs = _runs(name, checks[name], implementations, bindings.get(name))
+        if not runs:
+            skipped.append(CheckResult(name, 'SKIP', 0.0, ''))
+        for job, arguments in runs.items():
+            jobs[job] = (checks[name], arguments)
+            if workers <= 1 or any(arg is w for arg in arguments.values() for w in writers):
+                serial.add(job)
+    # Load the datasets before forking, so that the workers share them
+    errors = []
+    needed = _preloads(jobs.values(), implementations, {'TESTDATAFILE': testdatafile, 'DATAFILE': datafile})
+    for loader in LOADERS:
+        for path in (testdatafile, datafile):
+            if (loader, path) in needed:
+                res = _timed(f"{loader}({path!r})", functools.partial(implementations[loader], path))
+                if res.status != 'OK':
+                    errors.append(res)
+    start = time.perf_counter()
+    # The workers are forked, so they see the jobs of this run in _JOBS
+    previous = dict(_JOBS)
+    _JOBS.clear()
+    _JOBS.update(jobs)
+    try:
+        results = [_run(name) for name in jobs if name in serial]
+        parallel = [name for name in jobs if name not in serial]
+        if parallel:
+            if 'fork' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('fork')
+                with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                    results += pool.map(_run, parallel)
+            else:
+                # Implementations defined in a notebook can only reach forked workers
+                results += [_run(name) for name in parallel]
+    finally:
+        _JOBS.clear()
+        _JOBS.update(previous)
+    results += errors
+    results = sorted(results + skipped)
+    if verbose:
+        for res in results:
+            print(f"{res.name:<40s} {res.status:<6s}{res.seconds:9.3f}s  {res.error}")
+        print(f"{sum(r.status == 'OK' for r in results)}/{len(results)} checks OK "
+              f"in {time.perf_counter() - start:.1f}s")
+    return results
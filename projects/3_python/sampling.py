@@ -0,0 +1,202 @@
+"""
+Generation of sample files of the employment CSV files.
+
+`gen_sample` in 01_python keeps each line with a given probability, so the
+size of the sample is only right on average. Here the source file is
+memory-mapped and indexed once, and several samples are taken from that
+single read:
+
+- 'count': exactly round(ratio * lines) lines, chosen with reservoir
+  sampling (Algorithm L), which skips over lines without looking at them.
+- 'bytes': random lines until the file reaches ratio * size bytes, which
+  puts its size within one line of the target.
+- 'stratified': exact-count samples of each district (or year), so every
+  group keeps its proportion.
+
+Selected lines are written in file order with one bulk write per sample.
+"""
+import csv
+import mmap
+import os
+import random
+from itertools import islice
+from math import exp, floor, log, log1p
+from typing import Iterable, Sequence
+
+import numpy as np
+
+RATIOS = (0.01, 0.02, 0.05, 0.1)
+_END = object()
+
+
+def sample_filename(filename: str, ratio: float) -> str:
+    '''
+    Name of the sample file: the original one with the ratio as a
+    two-digit percentage before the extension
+    Examples:
+        >>> sample_filename('inscritos.csv', 0.05)
+        'inscritos_05.csv'
+        >>> sample_filename('inscritos', 0.1)
+        'inscritos_10'
+    '''
+    name, dot, ext = filename.rpartition('.')
+    if not dot:
+        return f"{filename}_{round(ratio * 100):02d}"
+    return f"{name}_{round(ratio * 100):02d}.{ext}"
+
+
+def _uniform(rng) -> float:
+    # random() may return 0.0, whose logarithm is not defined
+    u = rng.random()
+    while u == 0.0:
+        u = rng.random()
+    return u
+
+
+def reservoir_sample(items: Iterable, k: int, rng=random) -> list:
+    '''
+    Uniform sample without replacement of k items of an iterable of unknown
+    length (Algorithm L). The items between two replacements are skipped
+    in bulk with geometric jumps, so most of them are never looked at.
+    Args:
+        items (Iterable): the population, read only once
+        k (int): size of the sample
+        rng: source of random numbers, the `random` module by default
+    Returns:
+        list: the sample, in no particular order (all the items if there are fewer than k)
+    Examples:
+        >>> sorted(reservoir_sample(range(10), 10))
+        [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+        >>> len(reservoir_sample(range(1000), 25, random.Random(1)))
+        25
+    '''
+    it = iter(items)
+    reservoir = list(islice(it, k)) if k > 0 else []
+    if len(reservoir) < k or k <= 0:
+        return reservoir
+    w = exp(log(_uniform(rng)) / k)
+    while True:
+        skip = floor(log(_uniform(rng)) / log1p(-w))
+        item = next(islice(it, skip, None), _END)
+        if item is _END:
+            return reservoir
+        reservoir[rng.randrange(k)] = item
+        w *= exp(log(_uniform(rng)) / k)
+
+
+def _line_index(data) -> tuple[int, np.ndarray, np.ndarray]:
+    '''
+    End of the header and (start, end) offsets of the non blank data lines
+    '''
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if len(buf) == 0:
+        return 0, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    newlines = np.flatnonzero(buf == 10) + 1
+    size = len(buf)
+    header_end = int(newlines[0]) if len(newlines) else size
+    ends = newlines[1:] if len(newlines) else newlines
+    if size > (int(ends[-1]) if len(ends) else header_end):
+        ends = np.append(ends, size)
+    starts = np.concatenate(([header_end], ends[:-1])).astype(np.int64)
+    lengths = ends - starts
+    # Blank lines ('\n' or '\r\n') are not records
+    blank = (lengths == 1) | ((lengths == 2) & (buf[np.minimum(starts, size - 1)] == 13))
+    return header_end, starts[~blank], ends[~blank]
+
+
+def _strata(data, starts: np.ndarray, ends: np.ndarray, header: list[str], by: str) -> np.ndarray:
+    '''
+    Group of every line: its district description or its registration year
+    '''
+    column = 'FECHA_INSCRIPCION' if by == 'year' else by
+    if column not in header:
+        raise ValueError(f"Unknown column {column}")
+    pos = header.index(column)
+    lines = (bytes(data[s:e]).decode('utf-8') for s, e in zip(starts, ends))
+    values = [(row[pos] if len(row) > pos else '').strip() for row in csv.reader(lines, delimiter=';')]
+    if by == 'year':
+        values = [v.rpartition('-')[2] for v in values]
+    groups: dict[str, int] = {}
+    return np.array([groups.setdefault(v, len(groups)) for v in values], dtype=np.int64)
+
+
+def _select(mode: str, ratio: float, lengths: np.ndarray, header_size: int,
+            total_size: int, strata: np.ndarray | None, rng) -> np.ndarray:
+    '''
+    Sorted indices of the lines of a sample
+    '''
+    n = len(lengths)
+    if mode == 'count':
+        chosen = reservoir_sample(range(n), round(ratio * n), rng)
+    elif mode == 'bytes':
+        order = np.random.default_rng(rng.getrandbits(64)).permutation(n)
+        target = ratio * total_size - header_size
+        # Stop at the first line that reaches the target size
+        sizes = np.cumsum(lengths[order])
+        chosen = order[:int(np.searchsorted(sizes, target)) + 1] if target > 0 else order[:0]
+    elif mode == 'stratified':
+        chosen = []
+        by_group = np.argsort(strata, kind='stable')
+        for members in np.split(by_group, np.cumsum(np.bincount(strata))[:-1]):
+            chosen += [members[i] for i in reservoir_sample(range(len(members)),
+                                                            round(ratio * len(members)), rng)]
+    else:
+        raise ValueError(f"Unknown sampling mode {mode}")
+    return np.sort(np.asarray(chosen, dtype=np.int64))
+
+
+def gen_samples(filename: str, ratios: Sequence[float] = RATIOS, mode: str = 'count',
+                by: str = 'DISTRITO_DESC', seed: int | None = None) -> dict[float, str]:
+    '''
+    Creates several sample files of a csv file, reading it only once. The
+    header is always included and lines keep their original order.
+    Args:
+        filename (str): name of the original file
+        ratios (Sequence[float]): fraction of the file in each sample (between 0 and 1)
+        mode (str): 'count' (exact number of lines), 'bytes' (size of the file)
+            or 'stratified' (exact number of lines of each group)
+        by (str): column that defines the groups in 'stratified' mode, or 'year'
+        seed (int): seed of the random numbers; the `random` module is used if None
+    Returns:
+        dict[float, str]: name of the sample file of each ratio
+    Examples:
+        >>> gen_samples("inscritos.csv", [0.01, 0.05])  # doctest: +SKIP
+        {0.01: 'inscritos_01.csv', 0.05: 'inscritos_05.csv'}
+    '''
+    for ratio in ratios:
+        if not 0 <= ratio <= 1:
+            raise ValueError("Probability must be between 0 and 1")
+    rng = random.Random(seed) if seed is not None else random
+    total_size = os.path.getsize(filename)
+    created = {}
+    with open(filename, 'rb') as f, \
+         (mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if total_size else memoryview(b'')) as data:
+        header_end, starts, ends = _line_index(data)
+        header = data[:header_end]
+        strata = None
+        if mode == 'stratified':
+            names = next(csv.reader([bytes(header).decode('utf-8-sig')], delimiter=';'), [])
+            strata = _strata(data, starts, ends, names, by)
+        for ratio in ratios:
+            chosen = _select(mode, ratio, ends - starts, header_end, total_size, strata, rng)
+            new_filename = sample_filename(filename, ratio)
+            with open(new_filename, 'wb') as sample_file:
+                sample_file.write(b''.join([header] + [data[s:e] for s, e in
+                                                       zip(starts[chosen], ends[chosen])]))
+            created[ratio] = new_filename
+    return created
+
+
+def gen_sample(filename: str, probability: float) -> None:
+    '''
+    Creates a sample file with round(probability * lines) random lines of
+    the original file, plus its header
+    Args:
+        filename (str): name of the original file
+        probability (float): fraction of the lines in the sample (between 0 and 1)
+    Returns:
+        None
+    Examples:
+        >>> gen_sample("inscritos.csv", 0.05)  # doctest: +SKIP
+    '''
+    gen_samples(filename, [probability])
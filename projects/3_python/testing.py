@@ -51,6 +51,34 @@ def test_gen_sample(gen_sample):
         test(size)
 
 
+def test_gen_samples(gen_samples):
+    import csv
+    from collections import Counter
+
+    def read(filename):
+        with open(filename, 'r', encoding="utf-8-sig", newline='') as f:
+            return list(csv.DictReader(f, delimiter=';'))
+
+    sizes = [0.01, 0.02, 0.05, 0.1]
+    full = read(DATAFILE)
+    fullsize = os.path.getsize(DATAFILE)
+    for new_file, size in zip(gen_samples(DATAFILE, sizes, mode='count', seed=42).values(), sizes):
+        n = len(read(new_file))
+        assert n == round(size * len(full)), f"Expected {round(size * len(full))} lines in {new_file}, got {n}"
+    print("count samples OK")
+    for new_file, size in zip(gen_samples(DATAFILE, sizes, mode='bytes', seed=42).values(), sizes):
+        samplesize = os.path.getsize(new_file)
+        assert fullsize*size*0.99 <= samplesize <= fullsize*size*1.01, \
+            f"Sample size {size} does not match expected size in {new_file}"
+    print("byte samples OK")
+    districts = Counter(row['DISTRITO_DESC'] for row in full)
+    for new_file, size in zip(gen_samples(DATAFILE, sizes, mode='stratified', seed=42).values(), sizes):
+        sample = Counter(row['DISTRITO_DESC'] for row in read(new_file))
+        for district, n in districts.items():
+            assert sample[district] == round(size * n), \
+                f"Expected {round(size * n)} lines of {district} in {new_file}, got {sample[district]}"
+    print("stratified samples OK")
+
 def test_gen_sample_checks(gen_sample):
     ok = False
     try:
@@ -157,6 +185,23 @@ def test_str2ym_typehints(str2ym):
     print("str2ym type hints OK")
 
 
+def test_batch_parsers(str2int_batch, str2dt_batch, str2my_batch):
+    cases = [(str2int_batch, ["123", "0", "abc", "123", "99999999999", "-2147483648"], [123, 0, 0, 123, 0, -2147483648]),
+             (str2dt_batch, ["", "2025-08-07 00:11:57.897", "", "2025-08-07 00:11:57.123456", "10000-01-01 00:00:00.0"],
+              [datetime(1970, 1, 1), datetime(2025, 8, 7, 0, 11, 57, 897000), datetime(1970, 1, 1),
+               datetime(2025, 8, 7, 0, 11, 57, 123456), datetime(1970, 1, 1)]),
+             (str2my_batch, ["ene-24", "dic-14", "", "ene-24", "ene-8000", "ene-7999"],
+              [datetime(2024, 1, 1), datetime(2014, 12, 1), datetime(1970, 1, 1), datetime(2024, 1, 1),
+               datetime(1970, 1, 1), datetime(9999, 1, 1)])]
+    for fun, values, expected in cases:
+        for column in (values, np.array(values)):
+            res = fun(column)
+            assert isinstance(res, np.ndarray), f"{fun.__name__} should return a numpy array"
+            if np.issubdtype(res.dtype, np.datetime64):
+                res = res.astype('datetime64[us]')
+            assert res.tolist() == expected, f"Expected {expected} for input {values}, but got {res.tolist()}"
+        print(f"{fun.__name__} OK")
+
 def test_add_row(fun):
     data = {"FECHA_INSCRIPCION": [],
             "GENERO_DESC": [],
@@ -247,6 +292,85 @@ def test_load_employment(load_employment):
                    "There are 123 records with professional_objective1_code 0"
     print("load_employment OK")
 
+def test_load_employment_columnar(load_employment_columnar):
+    expected = LOAD_EMPLOYMENT(TESTDATAFILE)
+    data = load_employment_columnar(TESTDATAFILE)
+    assert set(data.keys()) == set(expected.keys()), "Keys do not match expected keys"
+    for k in expected:
+        assert len(data[k]) == len(expected[k]), \
+            f"Expected {len(expected[k])} records in {k}, but got {len(data[k])}"
+        assert list(data[k]) == list(expected[k]), f"Values of column {k} do not match"
+    assert str(data['EDAD'].dtype) == 'int32', f"Expected int32 ages, got {data['EDAD'].dtype}"
+    assert str(np.asarray(data['FECHA_INSCRIPCION']).dtype) == 'datetime64[M]', \
+        "FECHA_INSCRIPCION should be stored as datetime64[M]"
+    assert str(np.asarray(data['FX_CARGA']).dtype) == 'datetime64[us]', \
+        "FX_CARGA should be stored as datetime64[us]"
+    print("load_employment_columnar OK")
+
+def test_employment_cache(load_employment_cached, load_employment_columnar):
+    import json
+    import shutil
+    import tempfile
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, os.path.basename(TESTDATAFILE))
+        shutil.copy(TESTDATAFILE, path)
+        expected = load_employment_columnar(path)
+        for _ in range(2):
+            data = load_employment_cached(path)
+            for k in expected:
+                assert list(data[k]) == list(expected[k]), f"Cached column {k} does not match"
+        assert isinstance(data['EDAD'], np.memmap), "Cached columns should be memory-mapped"
+        with open(path, encoding='utf-8-sig') as f:
+            last = f.read().splitlines()[-1]
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(last + '\n')
+        n = len(load_employment_cached(path)['EDAD'])
+        assert n == len(expected['EDAD']) + 1, "The cache was not invalidated after changing the file"
+        other = os.path.join(tmpdir, 'other.csv')
+        shutil.copy2(path, other)
+        load_employment_cached(other, path + '.cache')
+        with open(os.path.join(path + '.cache', 'meta.json'), encoding='utf-8') as f:
+            source = json.load(f)['source']
+        assert source == os.path.abspath(other), "The cache of another csv was reused"
+    finally:
+        shutil.rmtree(tmpdir)
+    print("employment cache OK")
+
+def test_instrumented(instrumented, load_employment_columnar):
+    import json
+    import tempfile
+    namespace = {'load_employment_columnar': load_employment_columnar}
+    size = len(load_employment_columnar(TESTDATAFILE)['FECHA_INSCRIPCION'])
+    with instrumented(namespace, ['load_employment_columnar']) as metrics:
+        assert namespace['load_employment_columnar'] is not load_employment_columnar, \
+            "load_employment_columnar is not instrumented inside the block"
+        for _ in range(2):
+            namespace['load_employment_columnar'](TESTDATAFILE)
+        try:
+            namespace['load_employment_columnar'](TESTDATAFILE + '.missing')
+        except OSError:
+            pass
+    assert namespace['load_employment_columnar'] is load_employment_columnar, \
+        "load_employment_columnar was not restored after the block"
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'metrics.json')
+        metrics.to_json(path)
+        with open(path, encoding='utf-8') as f:
+            stats = json.load(f)['functions']['load_employment_columnar']
+        prometheus = metrics.to_prometheus(os.path.join(folder, 'metrics.prom'))
+    assert (stats['calls'], stats['errors'], stats['rows']) == (3, 1, 2 * size), \
+        f"Expected 3 calls, 1 error and {2 * size} rows, got {stats['calls']}, {stats['errors']} and {stats['rows']}"
+    assert stats['seconds'] > 0 and 0 < stats['mean_s'] <= stats['seconds'] and 0 < stats['p99_s'] <= stats['seconds'], \
+        f"Wrong timings: {stats}"
+    assert stats['rows_per_s'] > 0, "rows_per_s should be positive"
+    for line in ['empleo_calls_total{function="load_employment_columnar"} 3',
+                 'empleo_errors_total{function="load_employment_columnar"} 1',
+                 f'empleo_rows_total{{function="load_employment_columnar"}} {2 * size}',
+                 f'empleo_seconds_total{{function="load_employment_columnar"}} {stats["seconds"]}']:
+        assert line in prometheus.splitlines(), f"Missing line in the Prometheus export: {line}"
+    print("instrumentation OK")
+
 def test_load_employment_typehints(load_employment):
     assert load_employment.__annotations__, 'The function does not have type hints'
     print(f"test: {set(map(str, load_employment.__annotations__.values()))}")
@@ -286,6 +410,19 @@ def test_people_by_district_typehints(people_by_district):
     assert set(map(str, people_by_district.__annotations__.values())) == {"<class '__main__.EmploymentData'>", 'list[tuple[str, int]]'}
     print("people_by_district type hints OK")
 
+def test_dictionary_encoding(load_employment_columnar, code_conflicts):
+    data = load_employment_columnar(TESTDATAFILE)
+    for col in ["GENERO_DESC", "DISTRITO_DESC", "NACIONALIDAD_DESC", "OBJETIVOPROFESIONAL1_DESC",
+                "OBJETIVOPROFESIONAL2_DESC", "OBJETIVOPROFESIONAL3_DESC"]:
+        categories = data[col].categories
+        assert len(set(categories)) == len(categories), f"Repeated categories in {col}"
+        assert all(c == c.strip() for c in categories), f"Categories of {col} are not stripped"
+    assert data["OBJETIVOPROFESIONAL1_DESC"].categories is data["OBJETIVOPROFESIONAL2_DESC"].categories \
+        is data["OBJETIVOPROFESIONAL3_DESC"].categories, "Professional objectives should share their vocabulary"
+    conflicts = code_conflicts(data)
+    assert conflicts == {}, f"Codes with several descriptions: {conflicts}"
+    print("dictionary encoding OK")
+
 def test_mean_age_by_district(mean_age_by_district):
     lst = LOAD_EMPLOYMENT(TESTDATAFILE)
     d = mean_age_by_district(lst)
@@ -327,6 +464,60 @@ def test_mean_age_by_district_typehints(fun):
     _test_type_hints(fun,
                      {"<class '__main__.EmploymentData'>", 'dict[str, float]'})
 
+def test_age_stats(age_stats, mean_age_by_district, iter_chunks):
+    ed = LOAD_EMPLOYMENT(TESTDATAFILE)
+    expected = mean_age_by_district(ed)
+    stats = age_stats(ed)
+    means = stats.mean()
+    assert means.keys() == expected.keys(), "Districts with mean age do not match"
+    for dist in expected:
+        assert math.isclose(means[dist], expected[dist]), \
+            f"Mean age for {dist} expected {expected[dist]}, but got {means[dist]}"
+        ages = [a for d, a in zip(ed['DISTRITO_DESC'], ed['EDAD']) if d == dist and a > 0]
+        assert math.isclose(stats.variance()[dist], np.var(ages)), f"Variance of the ages of {dist} does not match"
+        assert stats.median()[dist] == sorted(ages)[(len(ages) - 1) // 2], f"Median age of {dist} does not match"
+        assert stats.missing[dist] == sum(1 for d, a in zip(ed['DISTRITO_DESC'], ed['EDAD']) if d == dist and a <= 0), \
+            f"Missing ages of {dist} do not match"
+    chunks = [age_stats(chunk) for chunk in iter_chunks(TESTDATAFILE, 100)]
+    merged = chunks[0]
+    for chunk in chunks[1:]:
+        merged.merge(chunk)
+    assert merged.count() == stats.count() and merged.median() == stats.median(), "Merged chunks do not match"
+    for dist, var in stats.variance().items():
+        assert math.isclose(merged.variance()[dist], var), f"Merged variance of {dist} does not match"
+    print("age stats OK")
+
+def test_occupation_index(load_occupation_index):
+    import shutil
+    import tempfile
+    ed = LOAD_EMPLOYMENT(TESTDATAFILE)
+    slots = ['OBJETIVOPROFESIONAL1_COD', 'OBJETIVOPROFESIONAL2_COD', 'OBJETIVOPROFESIONAL3_COD']
+    codes = [{a, b, c} - {0} for a, b, c in zip(*[ed[s] for s in slots])]
+    folder = tempfile.mkdtemp()
+    try:
+        index = load_occupation_index(TESTDATAFILE, os.path.join(folder, 'occupations'))
+        for code in sorted(set().union(*codes)):
+            expected = [i for i, c in enumerate(codes) if code in c]
+            assert index.rows_for(code).tolist() == expected, f"Records of occupation {code} do not match"
+        district, year = ed['DISTRITO_DESC'][0], ed['FECHA_INSCRIPCION'][0].year
+        rows = [i for i, (d, f) in enumerate(zip(ed['DISTRITO_DESC'], ed['FECHA_INSCRIPCION']))
+                if d == district and f.year == year]
+        counts = {}
+        for i in rows:
+            for code in codes[i]:
+                counts[code] = counts.get(code, 0) + 1
+        expected = sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))[:5]
+        top = index.top_occupations(district, 5, year)
+        assert [(c, n) for c, _, n in top] == expected, f"Top occupations of {district} in {year} do not match"
+        code = expected[0][0]
+        assert index.query(code, district, year).tolist() == [i for i in rows if code in codes[i]], \
+            f"Records of occupation {code} in {district} and {year} do not match"
+        reloaded = load_occupation_index(TESTDATAFILE, os.path.join(folder, 'occupations'))
+        assert reloaded.top_by_district(5) == index.top_by_district(5), "Saved index does not match"
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    print("occupation index OK")
+
 
 def test_year_month_data(year_month_data):
     ed = LOAD_EMPLOYMENT(TESTDATAFILE)
@@ -346,6 +537,98 @@ def test_year_month_data_typehints(fun):
     expected = {"<class '__main__.EmploymentData'>", 'tuple[numpy.array, int]'}
     _test_type_hints(fun, expected)
 
+def test_aggregator(aggregate_csv, people_by_district, mean_age_by_district, year_month_data):
+    ed = LOAD_EMPLOYMENT(TESTDATAFILE)
+    agg = aggregate_csv(TESTDATAFILE)
+    assert agg.people_by_district() == people_by_district(ed), "District counts do not match"
+    means, expected = agg.mean_age_by_district(), mean_age_by_district(ed)
+    assert means.keys() == expected.keys(), "Districts with mean age do not match"
+    for dist in expected:
+        assert math.isclose(means[dist], expected[dist]), \
+            f"Mean age for {dist} expected {expected[dist]}, but got {means[dist]}"
+    ym_data, ini_y = agg.year_month_data()
+    exp_data, exp_y = year_month_data(ed)
+    assert ini_y == exp_y, f"Expected initial year {exp_y}, got {ini_y}"
+    assert np.array_equal(ym_data, exp_data), "Year-month matrices do not match"
+    # Aggregating by small chunks and merging must give the same result
+    merged = aggregate_csv(TESTDATAFILE, 100)
+    merged.merge(aggregate_csv(TESTDATAFILE, 1000))
+    assert np.array_equal(merged.year_month_data()[0], 2 * exp_data), "merge() does not add the matrices"
+    assert dict(merged.people_by_district()) == {d: 2 * n for d, n in people_by_district(ed)}, \
+        "merge() does not add the district counts"
+    print("aggregator OK")
+
+def test_ingest(ingest, load_ingested, ingested_aggregates, load_employment_columnar, aggregate_csv):
+    import shutil
+    import tempfile
+    with open(TESTDATAFILE, 'rb') as f:
+        lines = f.read().splitlines(keepends=True)
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, 'inscritos.csv')
+        half = len(lines) // 2
+        with open(path, 'wb') as f:
+            f.write(b''.join(lines[:half]))
+        res = ingest(path)
+        assert res['new_rows'] == half - 1, f"Expected {half - 1} new rows, got {res['new_rows']}"
+        # A segment written by a call interrupted before it saved its state
+        stale = os.path.join(path + '.ingest', 'segment_00001')
+        os.mkdir(stale)
+        with open(os.path.join(stale, 'meta.json'), 'w') as f:
+            f.write('{}')
+        with open(path, 'ab') as f:
+            f.write(b''.join(lines[half:]))
+        res = ingest(path)
+        assert res['new_rows'] == len(lines) - half, f"Expected {len(lines) - half} new rows, got {res['new_rows']}"
+        assert not res['rescanned'], "Appended rows should be read from the last offset"
+        assert not os.path.exists(stale), "Segments not in the state should be removed"
+        assert ingest(path)['new_rows'] == 0, "An unchanged file should not add rows"
+        expected = load_employment_columnar(TESTDATAFILE)
+        data = load_ingested(path)
+        for k in expected:
+            assert list(data[k]) == list(expected[k]), f"Column {k} differs after incremental ingestion"
+        agg, exp = ingested_aggregates(path), aggregate_csv(TESTDATAFILE)
+        assert agg.people_by_district() == exp.people_by_district(), "District counts do not match"
+        assert agg.mean_age_by_district() == exp.mean_age_by_district(), "Mean ages do not match"
+        assert np.array_equal(agg.year_month_data()[0], exp.year_month_data()[0]), "Year-month matrices do not match"
+        # All the records loaded at the same time, as in a single export
+        fx_carga = lines[1].rstrip(b'\r\n').rsplit(b';', 1)[1]
+        same = [line.rstrip(b'\r\n').rsplit(b';', 1)[0] + b';' + fx_carga + b'\n' for line in lines[1:]]
+        path = os.path.join(folder, 'export.csv')
+        with open(path, 'wb') as f:
+            f.write(lines[0] + b''.join(same[:half]))
+        ingest(path)
+        # An edit at the start of the file is not an append
+        with open(path, 'wb') as f:
+            f.write(lines[0] + same[1] + b''.join(same[1:]))
+        res = ingest(path)
+        assert res['rescanned'], "A file edited before the last offset should be read again"
+        assert res['new_rows'] == len(same) - half + 1, \
+            f"Expected {len(same) - half + 1} new rows at the watermark, got {res['new_rows']}"
+        # A new export in another order, with no new records
+        with open(path, 'wb') as f:
+            f.write(lines[0] + b''.join(reversed(same)) + same[1])
+        res = ingest(path)
+        assert res['rescanned'] and res['new_rows'] == 0, f"Expected no new rows, got {res['new_rows']}"
+        assert len(load_ingested(path)['FX_CARGA']) == len(same) + 1, "Records at the watermark were lost or repeated"
+    finally:
+        shutil.rmtree(folder)
+    print("incremental ingestion OK")
+
+def test_sqlite_backend(load_sqlite, sql_people_by_district, sql_mean_age_by_district, sql_year_month_data,
+                        people_by_district, mean_age_by_district, year_month_data):
+    ed = LOAD_EMPLOYMENT(TESTDATAFILE)
+    db = load_sqlite(TESTDATAFILE)
+    assert sql_people_by_district(db) == people_by_district(ed), "District counts do not match"
+    means, expected = sql_mean_age_by_district(db), mean_age_by_district(ed)
+    assert means == expected, "Mean ages by district do not match"
+    ym_data, ini_y = sql_year_month_data(db)
+    exp_data, exp_y = year_month_data(ed)
+    assert ini_y == exp_y, f"Expected initial year {exp_y}, got {ini_y}"
+    assert np.array_equal(ym_data, exp_data), "Year-month matrices do not match"
+    assert load_sqlite(TESTDATAFILE) == db, "The database should be reused while the file does not change"
+    print("sqlite backend OK")
+
 def test_sum_by_month_year(sum_by_month_year):
     ym_data2 = \
       np.array([[ 9, 10,  9, 10,  3, 20, 17, 10,  7,  7, 23, 15],
@@ -381,6 +664,22 @@ def test_max_requests_typehints(fun):
                 "<class 'int'>"}
     _test_type_hints(fun, expected)
 
+def test_top_k_months(top_k_months, peaks_by_year):
+    ym_data2 = \
+      np.array([[ 9, 10,  9, 10,  3, 20, 17, 10,  7,  7, 23, 15],
+                [12, 17, 15, 11, 11, 13, 15,  4, 12, 24, 14, 17],
+                [17, 11, 21, 13, 19, 13, 16, 12, 10, 16, 15, 17]])
+    res = top_k_months(ym_data2, 2020, 4)
+    exp = [(2021, 'oct', 24), (2020, 'nov', 23), (2022, 'mar', 21), (2020, 'jun', 20)]
+    assert res == exp, f"Expected {exp}, got {res}"
+    res = top_k_months(ym_data2, 2020, 3, from_year=2022)
+    exp = [(2022, 'mar', 21), (2022, 'may', 19), (2022, 'ene', 17)]
+    assert res == exp, f"Expected {exp}, got {res}"
+    res = peaks_by_year(ym_data2, 2020)
+    exp = [(2020, 'nov', 23), (2021, 'oct', 24), (2022, 'mar', 21)]
+    assert res == exp, f"Expected {exp}, got {res}"
+    print("top_k_months OK")
+
 def test_by_quarters(by_quarters):
     ym_data2 = \
       np.array([[ 9, 10,  9, 10,  3, 20, 17, 10,  7,  7, 23, 15],
@@ -400,6 +699,22 @@ def test_by_quarters_typehints(fun):
     _test_type_hints(fun, expected)
 
 
+def test_cube(build_cube, year_month_data, by_quarters):
+    ed = LOAD_EMPLOYMENT(TESTDATAFILE)
+    exp_data, exp_y = year_month_data(ed)
+    cube = build_cube(ed, ['year', 'month', 'DISTRITO_COD', 'GENERO_DESC', 'age_bucket'])
+    assert cube.total() == 1508, f"Expected 1508 records, but got {cube.total()}"
+    ym = cube.sum('year', 'month')
+    assert int(ym.labels[0][0]) == exp_y, f"Expected initial year {exp_y}, got {ym.labels[0][0]}"
+    assert np.array_equal(ym.to_array(), exp_data), "Year-month roll-up does not match year_month_data"
+    quarters = ym.regroup('month', np.arange(12) // 3, ['T1', 'T2', 'T3', 'T4'], 'quarter')
+    assert np.array_equal(quarters.to_array(), by_quarters(exp_data)), "Quarter roll-up does not match by_quarters"
+    dims = ['DISTRITO_COD', 'OBJETIVOPROFESIONAL1_COD', 'year', 'month']
+    dense, sparse = build_cube(ed, dims, sparse=False), build_cube(ed, dims, sparse=True)
+    assert np.array_equal(dense.to_array(), sparse.to_array()), "Sparse and dense cubes differ"
+    assert np.array_equal(sparse.sum('year', 'month').to_array(), exp_data), "Sparse roll-up does not match"
+    print("cube OK")
+
 def test_load_dataframe(load_dataframe):
     data = load_dataframe('inscritos.csv')
     size = (150137, 15)
@@ -433,6 +748,41 @@ def test_load_dataframe(load_dataframe):
     print('OK')
 
 
+def test_parallel_ingestion(load_employment_columnar, load_dataframe, load_dataframe_parallel, workers=4):
+    for path, size in [(TESTDATAFILE, 1508), (DATAFILE, 150137)]:
+        serial = load_employment_columnar(path)
+        parallel = load_employment_columnar(path, workers=workers)
+        assert len(parallel['FECHA_INSCRIPCION']) == size, \
+            f"Expected {size} records, but got {len(parallel['FECHA_INSCRIPCION'])}"
+        for k in serial:
+            assert list(parallel[k]) == list(serial[k]), f"Column {k} of {path} differs with {workers} workers"
+        serial = load_dataframe(path)
+        parallel = load_dataframe_parallel(path, workers)
+        assert parallel.shape == (size, 15), f'El tamaño del dataframe debe ser {(size, 15)}, el tuyo es {parallel.shape}'
+        assert parallel.equals(serial), f"The dataframe of {path} differs with {workers} workers"
+        print(f"{path} with {workers} workers OK")
+    import shutil
+    import tempfile
+    with open(TESTDATAFILE, encoding='utf-8-sig') as f:
+        lines = f.read().splitlines(keepends=True)
+    folder = tempfile.mkdtemp()
+    try:
+        # Some records without FECHA_INSCRIPCION, spread over all the parts
+        path = os.path.join(folder, 'missing_dates.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(lines[0])
+            f.writelines(';' + line.split(';', 1)[1] if i % 7 == 0 else line for i, line in enumerate(lines[1:]))
+        serial = load_dataframe(path)
+        parallel = load_dataframe_parallel(path, workers)
+        assert parallel.equals(serial), f"The dataframe with missing dates differs with {workers} workers"
+        missing = serial['FECHA_INSCRIPCION'].isna()
+        assert missing.any() and (serial.loc[missing, 'ANYO_INSCRIPCION'] == 0).all(), \
+            "Missing dates should have year 0"
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    print(f"missing dates with {workers} workers OK")
+
+
 def test_reduce_cols(reduce_cols, load_dataframe):
     data = reduce_cols(load_dataframe('inscritos.csv'))
     size = (150137, 9)
@@ -457,11 +807,58 @@ def test_reduce_cols(reduce_cols, load_dataframe):
         assert str(data[c].dtype) == t, f'El tipo de la columna {c} no es {t}'
         print(f'El tipo de la columna {c} es {t}....OK')
 
+def test_load_columns(load_columns, load_dataframe, reduce_cols, columns):
+    full = reduce_cols(load_dataframe('inscritos.csv'))
+    data = load_columns('inscritos.csv', columns)
+    assert data.columns.to_list() == list(columns), f'Esperaba las columnas {list(columns)}, he obtenido {data.columns.to_list()}'
+    assert load_columns('inscritos.csv', columns, workers=4).equals(data), \
+        'Las columnas cargadas con varios procesos no coinciden'
+    for c in columns:
+        if c.endswith('_DESC'):
+            assert str(data[c].dtype) == 'category', f'La columna {c} debería ser category'
+        assert data[c].astype(full[c].dtype).equals(full[c]), f'La columna {c} no coincide con la de reduce_cols'
+    print('OK')
+
 def test_filter_year(filter_year, load_dataframe):
     data = filter_year(load_dataframe('inscritos_test_sample.csv'), 2022)
     assert all(map(lambda x: x==22, data['ANYO_INSCRIPCION'].to_list())), 'Los datos no están correctamente filtrados'
     print('OK')
 
+def test_load_year(load_year, filter_year, load_dataframe):
+    full = load_dataframe('inscritos_test_sample.csv')
+    for year in [2019, 2022, 2025]:
+        expected = filter_year(full, year).reset_index(drop=True)
+        data = load_year('inscritos_test_sample.csv', year)
+        assert data.shape == expected.shape, f'El tamaño del año {year} debe ser {expected.shape}, el tuyo es {data.shape}'
+        for c in expected.columns:
+            if expected[c].dtype.kind in 'iuf':
+                assert data[c].dtype == expected[c].dtype, \
+                    f'La columna {c} del año {year} debe ser {expected[c].dtype}, la tuya es {data[c].dtype}'
+            res = data[c].astype(expected[c].dtype).astype(object).fillna(-1)
+            assert res.equals(expected[c].astype(object).fillna(-1)), \
+                f'La columna {c} del año {year} no coincide con filter_year'
+        print(f'{year} OK')
+    import shutil
+    import tempfile
+    with open('inscritos_test_sample.csv', encoding='utf-8-sig') as f:
+        lines = f.read().splitlines(keepends=True)
+    folder = tempfile.mkdtemp()
+    try:
+        # Records without FECHA_INSCRIPCION do not belong to any year
+        path = os.path.join(folder, 'missing_dates.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(lines[0])
+            f.writelines(';' + line.split(';', 1)[1] if i % 7 == 0 else line for i, line in enumerate(lines[1:]))
+        full = load_dataframe(path)
+        dated = full['FECHA_INSCRIPCION'].notna()
+        years = sorted(set(2000 + full.loc[dated, 'ANYO_INSCRIPCION']))
+        total = sum(len(load_year(path, year)) for year in years)
+        assert total == dated.sum(), f'Los años deben sumar {dated.sum()} registros con fecha, los tuyos suman {total}'
+        assert len(load_year(path, 1970)) == 0, 'Los registros sin fecha no son del año 1970'
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    print('missing dates OK')
+
 def test_by_month(by_month, filter_year, load_dataframe):
     data = by_month(filter_year(load_dataframe('inscritos_test_sample.csv'), 2022))
     exp = [('ene', 11), ('feb', 21), ('mar', 13), ('abr', 16), ('may', 19), ('jun', 24),
@@ -470,6 +867,70 @@ def test_by_month(by_month, filter_year, load_dataframe):
     #assert all(map(lambda x: x==22, data['ANYO_INSCRIPCION'].to_list())), 'Los datos no están correctamente filtrados'
     print('OK')
 
+def test_load_aggregates(load_aggregates, load_employment_columnar):
+    import shutil
+    import tempfile
+    from collections import Counter
+    ed = load_employment_columnar(TESTDATAFILE)
+    months = ['ene', 'feb', 'mar', 'abr', 'may', 'jun', 'jul', 'ago', 'sep', 'oct', 'nov', 'dic']
+    dates = np.asarray(ed['FECHA_INSCRIPCION'], dtype='datetime64[M]').astype(int)
+    districts = [str(d) for d in ed['DISTRITO_DESC']]
+    # Missing dates are 1970-01 in the columnar data and are not counted
+    known = [i for i, d in enumerate(dates) if d != 0]
+    by_month = Counter((str(1970 + dates[i] // 12), months[dates[i] % 12]) for i in known)
+    by_district = Counter((str(1970 + dates[i] // 12), districts[i]) for i in known if districts[i])
+    folder = tempfile.mkdtemp()
+    try:
+        counts_path = os.path.join(folder, 'aggregates.json')
+        aggregates = load_aggregates(TESTDATAFILE, counts_path)
+        exp = {}
+        for (year, month), total in sorted(by_month.items(), key=lambda k: (k[0][0], months.index(k[0][1]))):
+            exp.setdefault(year, []).append((month, total))
+        data = aggregates['by_month']
+        assert data == exp, f'El resultado esperado es:\n {exp},\n el obtenido es:\n {data}'
+        data = Counter({(year, district): total for year, counts in aggregates['by_district'].items()
+                        for district, total in counts})
+        assert data == by_district, f'Los totales por distrito deben ser:\n {dict(by_district)},\n los tuyos son:\n {dict(data)}'
+        assert load_aggregates(TESTDATAFILE, counts_path) == aggregates, 'Los totales guardados no coinciden con los calculados'
+    finally:
+        shutil.rmtree(folder)
+    print('OK')
+
+def test_render_all(render_all):
+    import shutil
+    import tempfile
+    import unittest
+    try:
+        import matplotlib  # noqa: F401
+    except ImportError:
+        raise unittest.SkipTest('matplotlib no está instalado')
+    folder = tempfile.mkdtemp()
+    try:
+        data = os.path.join(folder, 'inscritos.csv')
+        shutil.copy(TESTDATAFILE, data)
+        out_dir = os.path.join(folder, 'report')
+        files = render_all(data, out_dir)
+        assert files, 'No se ha generado ningún gráfico'
+        for name in files:
+            assert os.path.dirname(name) == out_dir, f'{name} no está en {out_dir}'
+            with open(name, 'rb') as f:
+                assert f.read(8) == b'\x89PNG\r\n\x1a\n', f'{name} no es un fichero PNG'
+        assert render_all(data, out_dir, workers=2) == files, 'Los gráficos en paralelo no coinciden'
+        # A year without records gives empty charts
+        empty = render_all(data, out_dir, [2040])
+        assert len(empty) == 2 and all(os.path.exists(name) for name in empty), \
+            f'Los gráficos de 2040 deberían existir, he obtenido {empty}'
+    finally:
+        shutil.rmtree(folder)
+    print('OK')
+
+def test_no_regressions(compare_results, load_results, results, baseline_path='bench_results.json', threshold=0.2):
+    regressions = compare_results(results, load_results(baseline_path), threshold)
+    for name, rows, metric, before, after in regressions:
+        print(f"{name} ({rows} rows): {metric} {before:.3f} -> {after:.3f}")
+    assert not regressions, f"{len(regressions)} benchmarks are more than {threshold:.0%} worse than {baseline_path}"
+    print("benchmarks OK")
+
 def test_type_hints_load_dataframe(load_dataframe):
     expected = {"<class 'pandas.core.frame.DataFrame'>", "<class 'str'>"}
     _test_type_hints(load_dataframe, expected)
@@ -489,3 +950,17 @@ def test_type_hints_filter_year(filter_year):
 def test_type_hints_by_month(by_month):
     expected = {"<class 'pandas.core.frame.DataFrame'>", 'list[tuple[str, int]]'}
     _test_type_hints(by_month, expected)
+
+def test_run_checks(run_checks, load_employment, people_by_district, mean_age_by_district, year_month_data):
+    implementations = {'load_employment': load_employment, 'people_by_district': people_by_district,
+                       'mean_age_by_district': mean_age_by_district, 'year_month_data': year_month_data}
+    only = {'test_load_employment', 'test_people_by_district', 'test_mean_age_by_district',
+            'test_year_month_data', 'test_people_by_district_typehints'}
+    # The selected checks only read the test file
+    serial = run_checks(implementations, TESTDATAFILE, TESTDATAFILE, only=only, workers=1, verbose=False)
+    parallel = run_checks(implementations, TESTDATAFILE, TESTDATAFILE, only=only, workers=2, verbose=False)
+    assert [r.name for r in serial] == sorted(only), f"Expected the checks {sorted(only)}, got {[r.name for r in serial]}"
+    for s, p in zip(serial, parallel):
+        assert (s.name, s.status, s.output, s.error) == (p.name, p.status, p.output, p.error), \
+            f"{s.name} gives {s.status} with 1 worker and {p.status} with 2"
+    print("run_checks OK")